@@ -0,0 +1,34 @@
+""" Measures the startup time of TrueColorTools modules, each case in a new Python process. """
+
+from argparse import ArgumentParser
+from statistics import median
+from subprocess import run
+from time import perf_counter
+import sys
+
+cases = {
+    'import src.auxiliary': 'import src.auxiliary',
+    'import src.core': 'import src.core',
+    'ColorSystem math': "from src.core import ColorSystem; ColorSystem('sRGB', 'Illuminant D65').xyz_to_rgb((0.3, 0.3, 0.3))",
+    'first sun_norm access': 'import src.core; src.core.sun_norm',
+    'import_DBs': "import src.database as db; db.import_DBs(('spectra', 'spectra_extras'))",
+    'import src.main (GUI)': 'import src.main',
+}
+
+def measure(code: str, repeats: int) -> float:
+    """ Returns the median wall time of the code execution in a new interpreter, in seconds """
+    times = []
+    for _ in range(repeats):
+        start = perf_counter()
+        run((sys.executable, '-c', code), check=True)
+        times.append(perf_counter() - start)
+    return median(times)
+
+parser = ArgumentParser(description='Startup-time benchmark of TrueColorTools')
+parser.add_argument('-r', '--repeats', type=int, default=5, help='number of runs of each case')
+args = parser.parse_args()
+
+baseline = measure('pass', args.repeats)
+print(f'Python interpreter startup: {baseline:.3f} s (subtracted below)')
+for name, code in cases.items():
+    print(f'{name:<24}{measure(code, args.repeats) - baseline:.3f} s')
@@ -1,10 +1,47 @@
 from argparse import ArgumentParser
-from src.main import launch_window
 
-# CLI parsing
-parser = ArgumentParser(description='See ReadMe on the GitHub page: https://github.com/Askaniy/TrueColorTools#readme')
-#parser.add_argument('-v', '--verbose', '--verbosity', action='count', help='increase level of output verbosity (-v, -vv, etc.)')
-parser.add_argument('-l', '--lang', '--language', type=str, default='en', help='set startup language, editable in GUI (en, de, ru)')
-args = parser.parse_args()
+if __name__ == '__main__':
 
-launch_window(args.lang)
\ No newline at end of file
+    # CLI parsing
+    parser = ArgumentParser(description='See ReadMe on the GitHub page: https://github.com/Askaniy/TrueColorTools#readme')
+    #parser.add_argument('-v', '--verbose', '--verbosity', action='count', help='increase level of output verbosity (-v, -vv, etc.)')
+    parser.add_argument('-l', '--lang', '--language', type=str, default='en', help='set startup language, editable in GUI (en, de, ru)')
+    batch = parser.add_argument_group('headless batch mode', 'calculate colors of the database objects without GUI')
+    batch.add_argument('-o', '--output', type=str, help='enable batch mode and save colors to the file (.csv, .json, .npz)')
+    batch.add_argument('--format', type=str, choices=('csv', 'json', 'npz'), help='output format, determined by the file extension by default')
+    batch.add_argument('--tag', type=str, default='ALL', help='process only objects with the tag (default: ALL)')
+    batch.add_argument('--color-space', type=str, default='sRGB', help='color space (default: sRGB)')
+    batch.add_argument('--white-point', type=str, default='Illuminant E', help='white point of chromatic adaptation, empty to disable (default: Illuminant E)')
+    batch.add_argument('--albedo', type=str, choices=('geometric', 'spherical'), default='geometric', help='albedo mode (default: geometric)')
+    batch.add_argument('--chromaticity', action='store_true', help='maximize brightness of all colors')
+    batch.add_argument('--no-gamma', action='store_true', help='disable gamma correction')
+    batch.add_argument('--sun-multiply', action='store_true', help='multiply reflection spectra by the Solar spectrum')
+    batch.add_argument('--scale-factor', type=float, default=1., help='brightness scale factor (default: 1)')
+    batch.add_argument('-t', '--tables', type=str, help='enable batch mode and save color tables of the tag in both albedo modes to the folder')
+    batch.add_argument('--table-langs', type=str, nargs='+', default=('en', 'de', 'ru'), help='languages of the color tables (default: en de ru)')
+    batch.add_argument('--workers', type=int, help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    if args.output is None and args.tables is None:
+        from src.main import launch_window
+        launch_window(args.lang)
+    if args.output is not None:
+        from src.core import ColorSystem
+        from src.batch_processing import run_batch
+        run_batch(
+            ('spectra', 'spectra_extras'), args.tag, ColorSystem(args.color_space, args.white_point),
+            args.output, args.format, args.workers,
+            gamma_correction=not args.no_gamma, maximize_brightness=args.chromaticity, scale_factor=args.scale_factor,
+            geom_albedo=args.albedo == 'geometric', sun_multiply=args.sun_multiply, lang=args.lang
+        )
+    if args.tables is not None:
+        from src.core import ColorSystem
+        from src.database import import_DBs, prefetch_file_spectra
+        from src.table_generator import generate_tables
+        objectsDB = import_DBs(('spectra', 'spectra_extras'))[0]
+        prefetch_file_spectra(objectsDB, tag=args.tag)
+        generate_tables(
+            objectsDB, (args.tag,), (ColorSystem(args.color_space, args.white_point),),
+            args.table_langs, not args.no_gamma, args.chromaticity, args.scale_factor, args.sun_multiply, args.tables,
+            workers=args.workers
+        )
@@ -1,10 +1,15 @@
 """ File containing constant and functions required in various places, but without dependencies """
 
 import numpy as np
-from scipy.interpolate import PchipInterpolator, CloughTocher2DInterpolator
 from math import sqrt, ceil
-from collections.abc import Sequence
+from functools import lru_cache
+from collections.abc import Sequence, Iterable
 from typing import Literal
+from types import ModuleType
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import importlib.util
+import sys
 
 
 
@@ -88,6 +93,56 @@ def spectral_binning(
         sd1 = np.diff(linear_interp(nm0, sd_cdf, nm1_edges, extrap_mode='linear'), axis=0) / step
     return br1, sd1
 
+def spectral_binning_chunks(
+        chunks: Iterable[tuple[np.ndarray, np.ndarray, np.ndarray | None]],
+        nm1: np.ndarray,
+        step: int | float
+    ) -> tuple[np.ndarray, np.ndarray | None]:
+    """
+    Streaming version of `spectral_binning()` for a 1D spectrum given by consecutive chunks of points (nm, br, sd).
+    Only the cumulative integrals at the bin edges are stored, so the memory usage does not depend on the input size.
+    Raises ValueError if the points are not sorted or have gaps of the step or more.
+    """
+    half_step = 0.5 * step
+    nm1_edges = np.append(nm1 - half_step, nm1[-1] + half_step)
+    cdf1 = None # cumulative integrals of brightness (and standard deviations) at the bin edges
+    for nm0, br0, sd0 in chunks:
+        y0 = np.atleast_2d(br0 if sd0 is None else np.stack((br0, sd0)))
+        if is_first := cdf1 is None:
+            cdf1 = np.empty((y0.shape[0], nm1_edges.size))
+            start = np.zeros(y0.shape[0])
+        else:
+            # Continuing from the last point of the previous chunk
+            nm0 = np.append(last_nm[-1], nm0)
+            y0 = np.hstack((last_y, y0))
+            start = last_cdf[:, -1]
+        nm0_diff = np.diff(nm0)
+        if np.any(nm0_diff < 0) or np.any(nm0_diff >= step):
+            raise ValueError('Points must be sorted and have no gaps of the step or more for binning')
+        cdf0 = np.empty(y0.shape)
+        cdf0[:, 0] = start
+        cdf0[:, 1:] = start[:, np.newaxis] + np.cumsum(0.5 * (y0[:, :-1] + y0[:, 1:]) * nm0_diff, axis=1) # Riemann sum
+        inside = (nm1_edges >= nm0[0]) & (nm1_edges <= nm0[-1])
+        for cdf0_row, cdf1_row in zip(cdf0, cdf1):
+            cdf1_row[inside] = np.interp(nm1_edges[inside], nm0, cdf0_row)
+        if is_first:
+            # Linear extrapolation to the left
+            outside = nm1_edges < nm0[0]
+            slope = (cdf0[:, 1] - cdf0[:, 0]) / (nm0[1] - nm0[0])
+            cdf1[:, outside] = cdf0[:, :1] + slope[:, np.newaxis] * (nm1_edges[outside] - nm0[0])
+        last_nm = nm0[-2:]
+        last_y = y0[:, -1:]
+        last_cdf = cdf0[:, -2:]
+    if cdf1 is None:
+        raise ValueError('No points to bin')
+    # Linear extrapolation to the right
+    outside = nm1_edges > last_nm[-1]
+    slope = (last_cdf[:, 1] - last_cdf[:, 0]) / (last_nm[1] - last_nm[0])
+    cdf1[:, outside] = last_cdf[:, 1:] + slope[:, np.newaxis] * (nm1_edges[outside] - last_nm[-1])
+    br1 = np.diff(cdf1[0]) / step
+    sd1 = np.diff(cdf1[1]) / step if cdf1.shape[0] == 2 else None
+    return br1, sd1
+
 def linear_interp(
     x0: np.ndarray,
     y0: np.ndarray,
@@ -319,13 +374,18 @@ def expand_1D_array(arr: np.ndarray, shape: int|tuple):
     return np.broadcast_to(arr[..., *new_axes], (*arr.shape, *shape))
 
 
-def custom_extrap(grid: Sequence, derivative: float|np.ndarray, corner_x: int|float, corner_y: float|np.ndarray) -> np.ndarray:
+def custom_extrap(
+        grid: Sequence, derivative: float|np.ndarray, corner_x: int|float, corner_y: float|np.ndarray, is_constant: bool = None
+    ) -> np.ndarray:
     """
     Returns an intuitive continuation of the function on the grid using information about the last point.
     Extrapolation bases on function f(x) = exp( (1-x²)/2 ): f' has extrema of ±1 in (-1, 1) and (1, 1).
     Therefore, it scales to complement the spectrum more easily than similar functions.
+    The function is extrapolated by constant if any derivative is zero, or as `is_constant` specifies.
     """
-    if np.all(derivative) == 0: # extrapolation by constant
+    if is_constant is None:
+        is_constant = np.all(derivative) == 0
+    if is_constant:
         return higher_dim(corner_y, grid.size, axis=0)
     else:
         grid = expand_1D_array(grid, corner_y.shape)
@@ -339,13 +399,76 @@ def extrap_sd(corner_y: float|np.ndarray, x_arr: np.ndarray):
 
 weights_center_of_mass = 1 - 1 / np.sqrt(2)
 
-def extrapolating(x: np.ndarray, y: np.ndarray, sd: np.ndarray, x_arr: np.ndarray, step: int, avg_steps=20):
+def corner_estimate(y_arr: np.ndarray, is_smooth_edge: bool, is_blue: bool, avg_steps=20):
+    """
+    Returns the derivative and the value at the corner point of the (multi-dimensional) curve edge,
+    taken directly for the smooth edge or averaged otherwise, see `extrapolating()`.
+    """
+    obj_shape = y_arr.shape[1:]
+    if is_blue:
+        if is_smooth_edge:
+            return y_arr[1]-y_arr[0], y_arr[0]
+        # Linear weights. Could be more complicated, but there is no need
+        avg_weights = expand_1D_array(np.arange(-avg_steps, 0)[avg_steps-y_arr.shape[0]:], obj_shape)
+        diff = np.average(np.diff(y_arr, axis=0), weights=avg_weights[:-1], axis=0)
+        return diff, np.average(y_arr, weights=avg_weights, axis=0) - diff * avg_steps * weights_center_of_mass
+    else:
+        if is_smooth_edge:
+            return y_arr[-1]-y_arr[-2], y_arr[-1]
+        avg_weights = expand_1D_array(np.arange(avg_steps)[:y_arr.shape[0]] + 1, obj_shape)
+        diff = np.average(np.diff(y_arr, axis=0), weights=avg_weights[1:], axis=0)
+        return diff, np.average(y_arr, weights=avg_weights, axis=0) + diff * avg_steps * weights_center_of_mass
+
+# Statistics of an edge not to be extrapolated, neutral for merging
+no_extrapolation_statistics = np.array((True, True, True, False, False))
+
+def extrapolation_statistics(x: np.ndarray, y: np.ndarray, x_arr: np.ndarray, avg_steps=20) -> np.ndarray:
+    """
+    Returns the boolean array of shape (2, 5) deciding the extrapolation of the (multi-dimensional) curve
+    to the blue (first row) and to the red (second row), see `extrapolating()`. The columns are whether:
+    - all the corner points are zero,
+    - the second derivative on the edge is non-positive everywhere, non-negative everywhere,
+    - any derivative is zero for the smooth edge estimate, for the averaged edge estimate.
+
+    The decisions are common to all points of a spatial axis, so the parts of an array are extrapolated
+    as the whole if the merged statistics of all the parts (see `merge_extrapolation_statistics()`) are used.
+    """
+    statistics = np.tile(no_extrapolation_statistics, (2, 1))
+    if len(x) > 1:
+        for row, is_blue, is_needed in ((0, True, x[0] > x_arr[0]), (1, False, x[-1] < x_arr[-1])):
+            if is_needed:
+                y_arr = y[:avg_steps] if is_blue else y[-avg_steps:]
+                diff2 = np.diff(np.diff(y_arr, axis=0), axis=0)
+                statistics[row] = (
+                    np.all(y[0 if is_blue else -1] == 0), np.all(diff2 <= 0), np.all(diff2 >= 0),
+                    np.all(corner_estimate(y_arr, True, is_blue, avg_steps)[0]) == 0,
+                    np.all(corner_estimate(y_arr, False, is_blue, avg_steps)[0]) == 0
+                )
+    return statistics
+
+def extrapolation_modes(edge_statistics: np.ndarray) -> tuple[bool, bool, bool]:
+    """ Returns whether the edge is zero, whether it is smooth and whether it is extrapolated by constant """
+    is_zero, is_non_positive, is_non_negative, is_constant_smooth, is_constant_averaged = edge_statistics
+    is_smooth_edge = is_non_positive | is_non_negative
+    return is_zero, is_smooth_edge, is_constant_smooth if is_smooth_edge else is_constant_averaged
+
+def merge_extrapolation_statistics(statistics1: np.ndarray, statistics2: np.ndarray) -> np.ndarray:
+    """ Combines the extrapolation statistics of two parts of an array, see `extrapolation_statistics()` """
+    merged = statistics1 & statistics2
+    merged[:, 3:] = statistics1[:, 3:] | statistics2[:, 3:]
+    return merged
+
+def extrapolating(
+        x: np.ndarray, y: np.ndarray, sd: np.ndarray, x_arr: np.ndarray, step: int, avg_steps=20,
+        statistics: np.ndarray = None
+    ):
     """
     Defines a (multi-dimensional) curve an intuitive continuation on the x_arr, if needed.
     In TCT works for spectra, filter systems and spectral cubes.
     `avg_steps` is a number of corner curve points to be averaged if the curve is not smooth.
     Averaging weights on this range grow linearly closer to the edge (from 0 to 1).
     The exponential growth of uncertainty is completely arbitrary and needs to be investigated.
+    The extrapolation modes are decided by the `statistics` of the whole array, if it is processed in parts.
     """
     obj_shape = y.shape[1:] # (,) for 1D; (n,) for 2D; (w, h) for 3D
     if len(obj_shape) >= 1:
@@ -367,23 +490,18 @@ def extrapolating(x: np.ndarray, y: np.ndarray, sd: np.ndarray, x_arr: np.ndarra
         x = x1
         y = y1
     else:
+        if statistics is None:
+            statistics = extrapolation_statistics(x, y, x_arr, avg_steps)
         if x[0] > x_arr[0]:
             # Extrapolation to blue
             x1 = np.arange(x_arr[0], x[0], step)
-            if np.all(y[0] == 0):
+            is_zero, is_smooth_edge, is_constant = extrapolation_modes(statistics[0])
+            if is_zero:
                 # Corner point is zero -> no extrapolation needed: most likely it's a filter profile
                 y1 = sd1 = np.zeros((x1.size, *obj_shape))
             else:
-                y_arr = y[:avg_steps]
-                if is_smooth(y_arr):
-                    diff = y[1]-y[0]
-                    corner_y = y[0]
-                else:
-                    # Linear weights. Could be more complicated, but there is no need
-                    avg_weights = expand_1D_array(np.arange(-avg_steps, 0)[avg_steps-y_arr.shape[0]:], obj_shape)
-                    diff = np.average(np.diff(y_arr, axis=0), weights=avg_weights[:-1], axis=0)
-                    corner_y = np.average(y_arr, weights=avg_weights, axis=0) - diff * avg_steps * weights_center_of_mass
-                y1 = custom_extrap(x1, diff/step, x[0], corner_y)
+                diff, corner_y = corner_estimate(y[:avg_steps], is_smooth_edge, True, avg_steps)
+                y1 = custom_extrap(x1, diff/step, x[0], corner_y, is_constant)
                 if not is_cube:
                     sd1 = sd_left + expand_1D_array(extrap_sd(corner_y, np.arange(int(x[0]-x_arr[0]), 0, -step) - step), obj_shape)
                     #                                                             ^^^ solves a bug with uint16
@@ -394,19 +512,13 @@ def extrapolating(x: np.ndarray, y: np.ndarray, sd: np.ndarray, x_arr: np.ndarra
         if x[-1] < x_arr[-1]:
             # Extrapolation to red
             x1 = np.arange(x[-1], x_arr[-1], step) + step
-            if np.all(y[0] == 0):
+            is_zero, is_smooth_edge, is_constant = extrapolation_modes(statistics[1])
+            if is_zero:
                 # Corner point is zero -> no extrapolation needed: most likely it's a filter profile
                 y1 = sd1 = np.zeros((x1.size, *obj_shape))
             else:
-                y_arr = y[-avg_steps:]
-                if is_smooth(y_arr):
-                    diff = y[-1]-y[-2]
-                    corner_y = y[-1]
-                else:
-                    avg_weights = expand_1D_array(np.arange(avg_steps)[:y_arr.shape[0]] + 1, obj_shape)
-                    diff = np.average(np.diff(y_arr, axis=0), weights=avg_weights[1:], axis=0)
-                    corner_y = np.average(y_arr, weights=avg_weights, axis=0) + diff * avg_steps * weights_center_of_mass
-                y1 = custom_extrap(x1, diff/step, x[-1], corner_y)
+                diff, corner_y = corner_estimate(y[-avg_steps:], is_smooth_edge, False, avg_steps)
+                y1 = custom_extrap(x1, diff/step, x[-1], corner_y, is_constant)
                 if not is_cube:
                     sd1 = sd_right + expand_1D_array(extrap_sd(corner_y, np.arange(0, x_arr[-1]-x[-1], step)), obj_shape)
             x = np.append(x, x1)
@@ -751,9 +863,9 @@ def color_indices_parser(indices: dict):
 # analytic expressions for the physical albedo and integral phase function could not be obtained.
 # Hence, the integration was done numerically for values of θ up to 60°."
 
-_alpha = np.array([0, 2, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 120, 130, 140, 150, 160, 170, 180]) / 180 * np.pi
-_theta = np.array([0, 10, 20, 30, 40, 50, 60]) / 180 * np.pi
-_k = np.array([
+_hapke_alpha = np.array([0, 2, 5, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100, 110, 120, 130, 140, 150, 160, 170, 180]) / 180 * np.pi
+_hapke_theta = np.array([0, 10, 20, 30, 40, 50, 60]) / 180 * np.pi
+_hapke_k = np.array([
     [1.00, 1.00, 1.00, 1.00, 1.00, 1.00, 1.00],
     [1.00, 0.997, 0.991, 0.984, 0.974, 0.961, 0.943],
     [1.00, 0.994, 0.981, 0.965, 0.944, 0.918, 0.881],
@@ -777,8 +889,16 @@ _k = np.array([
     [1.00, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
 ])
 
-_A, _B = np.meshgrid(_alpha, _theta, indexing='ij')
-hapke_k = CloughTocher2DInterpolator(np.column_stack([_A.ravel(), _B.ravel()]), _k.ravel())
+@lru_cache(maxsize=1)
+def _hapke_k_interpolator():
+    """ Builds the interpolator on the first call, since it is slow and rarely needed """
+    from scipy.interpolate import CloughTocher2DInterpolator
+    A, B = np.meshgrid(_hapke_alpha, _hapke_theta, indexing='ij')
+    return CloughTocher2DInterpolator(np.column_stack([A.ravel(), B.ravel()]), _hapke_k.ravel())
+
+def hapke_k(alpha: float|np.ndarray, theta: float|np.ndarray) -> float|np.ndarray:
+    """ Interpolates the tabulated K(α, θ) macroscopic roughness correction """
+    return _hapke_k_interpolator()(alpha, theta)
 
 def henyey_greenstein(alpha: np.ndarray, b: float, c: float):
     """ Double Henyey-Greenstein (1941) single particle scattering function """
@@ -788,7 +908,7 @@ def henyey_greenstein(alpha: np.ndarray, b: float, c: float):
 # HG1G2 base functions
 # https://github.com/milicolazo/Pyedra/blob/master/pyedra/datasets/penttila2016.csv
 
-_alpha = np.array([
+_hg1g2_alpha = np.array([
     0, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45, 0.5, 0.55, 0.6, 0.65, 0.7, 0.75,
     0.8, 0.85, 0.9, 0.95, 1, 1.25, 1.5, 1.75, 2, 2.5, 3, 3.5, 4, 4.5, 5, 5.5, 6, 6.5, 7, 7.5, 8, 9, 10,
     11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29, 30, 33, 36, 39, 42, 45,
@@ -837,9 +957,23 @@ _phi3 = np.array([
     0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0
 ])
 
-hg1g2_phi1 = PchipInterpolator(_alpha, _phi1, extrapolate=True)
-hg1g2_phi2 = PchipInterpolator(_alpha, _phi2, extrapolate=True)
-hg1g2_phi3 = PchipInterpolator(_alpha, _phi3, extrapolate=True)
+@lru_cache(maxsize=1)
+def _hg1g2_interpolators():
+    """ Builds the interpolators on the first call, since scipy.interpolate is slow to import """
+    from scipy.interpolate import PchipInterpolator
+    return tuple(PchipInterpolator(_hg1g2_alpha, phi, extrapolate=True) for phi in (_phi1, _phi2, _phi3))
+
+def hg1g2_phi1(alpha: float|np.ndarray) -> float|np.ndarray:
+    """ Interpolates the first HG1G2 base function """
+    return _hg1g2_interpolators()[0](alpha)
+
+def hg1g2_phi2(alpha: float|np.ndarray) -> float|np.ndarray:
+    """ Interpolates the second HG1G2 base function """
+    return _hg1g2_interpolators()[1](alpha)
+
+def hg1g2_phi3(alpha: float|np.ndarray) -> float|np.ndarray:
+    """ Interpolates the third HG1G2 base function """
+    return _hg1g2_interpolators()[2](alpha)
 
 
 # ------------ Color Processing Section ------------
@@ -859,6 +993,24 @@ def export_colors(rgb: tuple):
 
 # ------------ Other ------------
 
+def lazy_import(name: str) -> ModuleType:
+    """ Returns the module to be executed on the first attribute access """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """ Returns the pool of the worker processes, safe to be started from a multithreaded program """
+    # Forked processes would inherit the locks and pending cache entries held by other threads (e.g. in GUI),
+    # so the workers are spawned
+    return ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+
 def get_flag_index(flags: tuple):
     """ Returns index of active radio button """
     for index, flag in enumerate(flags):
@@ -0,0 +1,161 @@
+""" Provides headless processing of the spectra database: parallel color calculation and its columnar export. """
+
+from collections.abc import Sequence
+from pathlib import Path
+from os import cpu_count
+import json
+import csv
+import numpy as np
+
+from src.core import ObjectName, EmittingBody, ReflectingBody, ColorSystem, ColorLine, ColorObject, database_parser, get_sun_norm, xyz_color_system
+import src.database as db
+import src.auxiliary as aux
+
+
+# Color calculation in parallel processes
+
+# Processes with their own spectral data caches are started only for sufficiently long lists of objects
+min_objects_per_worker = 64
+
+def resolve_spectra(items: Sequence[tuple[ObjectName, dict]], geom_albedo: bool, sun_multiply: bool):
+    """ Parses database units and returns the lists of their spectra, albedo estimation and emission flags """
+    spectra = []
+    estimations = []
+    emissions = []
+    for obj_name, obj_data in items:
+        body = database_parser(obj_name, obj_data)
+        spectrum, estimated = body.get_spectrum('geometric' if geom_albedo else 'spherical')
+        if sun_multiply and isinstance(body, ReflectingBody):
+            # Multiply by Solar spectrum
+            spectrum *= get_sun_norm()
+        spectra.append(spectrum)
+        estimations.append(estimated)
+        emissions.append(isinstance(body, EmittingBody))
+    return spectra, estimations, emissions
+
+def _xyz_chunk(items: Sequence[tuple[ObjectName, dict]], geom_albedo: bool, sun_multiply: bool):
+    """ Worker function: parses database units and returns their XYZ colors of shape (3, N), albedo estimation and emission flags """
+    spectra, estimations, emissions = resolve_spectra(items, geom_albedo, sun_multiply)
+    return ColorLine.from_spectral_sequence(spectra).br, estimations, emissions
+
+def compute_xyz(
+        objectsDB: dict[ObjectName, dict], obj_names: Sequence[ObjectName],
+        geom_albedo: bool = True, sun_multiply: bool = False, workers: int = None
+    ) -> tuple[np.ndarray, list[bool | None], list[bool]]:
+    """
+    Calculates XYZ colors of the listed database objects, splitting the list between worker processes.
+    Returns the XYZ array of shape (3, N), the list of albedo estimation flags
+    (`None` if no albedo data, `True` if estimated, `False` if measured)
+    and the list of flags whether the object is an `EmittingBody`.
+    """
+    items = [(obj_name, objectsDB[obj_name]) for obj_name in obj_names]
+    if workers is None:
+        workers = cpu_count() or 1
+    workers = max(1, min(workers, len(items) // min_objects_per_worker))
+    if workers == 1:
+        if len(items) == 0:
+            return np.empty((3, 0)), [], []
+        return _xyz_chunk(items, geom_albedo, sun_multiply)
+    # Contiguous chunks preserve the order and keep the batched reconstruction efficient
+    bounds = np.linspace(0, len(items), workers + 1).astype('int')
+    chunks = [items[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+    with aux.process_pool(workers) as executor:
+        results = list(executor.map(_xyz_chunk, chunks, (geom_albedo,)*workers, (sun_multiply,)*workers))
+    xyz = np.concatenate([chunk[0] for chunk in results], axis=1)
+    estimations = [estimated for chunk in results for estimated in chunk[1]]
+    emissions = [is_emitting for chunk in results for is_emitting in chunk[2]]
+    return xyz, estimations, emissions
+
+def xyz_to_rgb(
+        xyz: np.ndarray, estimations: Sequence[bool | None], color_system: ColorSystem,
+        gamma_correction: bool = True, maximize_brightness: bool = False, scale_factor: float = 1.
+    ) -> np.ndarray:
+    """
+    Vectorized postprocessing of the XYZ colors of shape (3, N) similar to `ColorPoint.to_array()` of each color.
+    Brightness is maximized for each color separately, and always for the objects without albedo data.
+    """
+    rgb = np.nan_to_num(ColorLine(xyz, xyz_color_system).to_color_system(color_system).br, copy=True)
+    peaks = rgb.max(axis=0)
+    mask = np.array([maximize_brightness or estimated is None for estimated in estimations], dtype='bool')
+    mask &= peaks != 0
+    rgb[:, mask] /= peaks[mask]
+    if scale_factor != 1:
+        rgb *= scale_factor
+    if gamma_correction:
+        rgb = ColorObject.apply_gamma_correction(rgb)
+    return rgb
+
+def compute_colors(
+        objectsDB: dict[ObjectName, dict], tag: str, color_system: ColorSystem,
+        gamma_correction: bool = True, maximize_brightness: bool = False, scale_factor: float = 1.,
+        geom_albedo: bool = True, sun_multiply: bool = False, lang: str = 'en', workers: int = None
+    ) -> dict[str, list | np.ndarray]:
+    """ Calculates colors of the database objects with the specified tag and returns them as named columns """
+    obj_names = db.obj_names_list(objectsDB, tag)
+    xyz, estimations, _ = compute_xyz(objectsDB, obj_names, geom_albedo, sun_multiply, workers)
+    rgb = xyz_to_rgb(xyz, estimations, color_system, gamma_correction, maximize_brightness, scale_factor)
+    rgb8 = np.clip(rgb, 0, 1) * 255
+    return {
+        'name': [obj_name(lang) for obj_name in obj_names],
+        'X': xyz[0], 'Y': xyz[1], 'Z': xyz[2],
+        'R': rgb[0], 'G': rgb[1], 'B': rgb[2],
+        'hex': ['#{:02x}{:02x}{:02x}'.format(*rgb8[:, n].round().astype('int')) for n in range(rgb8.shape[1])],
+        'estimated': estimations,
+    }
+
+
+# Columnar export
+
+def _column_to_list(column: list | np.ndarray) -> list:
+    """ Converts numpy columns to lists of built-in types, replacing NaN with `None` """
+    if isinstance(column, np.ndarray):
+        return [None if np.isnan(value) else value for value in column.tolist()]
+    return list(column)
+
+def save_csv(columns: dict[str, list | np.ndarray], file: str | Path):
+    """ Saves the columns as a table of comma-separated values, `None` is written as an empty cell """
+    with open(file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns.keys())
+        for row in zip(*(_column_to_list(column) for column in columns.values())):
+            writer.writerow('' if value is None else value for value in row)
+
+def save_json(columns: dict[str, list | np.ndarray], file: str | Path):
+    """ Saves the columns as a JSON object of arrays """
+    with open(file, 'w', encoding='utf-8') as f:
+        json.dump({key: _column_to_list(column) for key, column in columns.items()}, f, ensure_ascii=False)
+
+def save_npz(columns: dict[str, list | np.ndarray], file: str | Path):
+    """ Saves the columns as a compressed NumPy archive of typed arrays, object columns are stored as strings """
+    arrays = {}
+    for key, column in columns.items():
+        if isinstance(column, np.ndarray):
+            arrays[key] = column
+        else:
+            arrays[key] = np.array([str(value) for value in column])
+    np.savez_compressed(file, **arrays)
+
+output_formats = {'csv': save_csv, 'json': save_json, 'npz': save_npz}
+
+def run_batch(
+        folders: Sequence[str], tag: str, color_system: ColorSystem, output: str | Path, file_format: str = None,
+        workers: int = None, **kwargs
+    ) -> dict[str, list | np.ndarray]:
+    """
+    Non-GUI entry point: imports the database, calculates colors of the objects with the specified tag
+    and saves them to the output file, which format is determined by its extension if not specified.
+    Other keyword arguments are passed to `compute_colors()`.
+    """
+    output = Path(output)
+    if file_format is None:
+        file_format = output.suffix.removeprefix('.').lower()
+    if file_format not in output_formats:
+        raise ValueError(f'Unsupported output format "{file_format}", choose from {tuple(output_formats)}.')
+    objectsDB, _ = db.import_DBs(folders)
+    # The worker processes then read the spectra from the sidecar files
+    db.prefetch_file_spectra(objectsDB, tag=tag)
+    columns = compute_colors(objectsDB, tag, color_system, workers=workers, **kwargs)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output_formats[file_format](columns, output)
+    print(f'Colors of {len(columns["name"])} objects are saved to {output}')
+    return columns
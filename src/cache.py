@@ -0,0 +1,153 @@
+""" In-memory caches of the imported and computed data, shared by the GUI and the processing threads """
+
+import sys
+from collections import OrderedDict, namedtuple
+from collections.abc import Callable, Hashable
+from functools import update_wrapper
+from threading import Lock, Event
+import numpy as np
+from PIL import Image
+
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'waits', 'evictions', 'entries', 'nbytes', 'budget'))
+
+def nbytes(value) -> int:
+    """
+    Estimates the memory size of the value by the NumPy arrays it holds.
+    Tuples and lists are summed, objects are measured by their array attributes,
+    images by the pixel data (decoded or not yet), other values by `sys.getsizeof()`.
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, Image.Image):
+        band_size = 4 if value.mode in ('I', 'F') else 2 if value.mode.startswith('I;16') else 1
+        return value.width * value.height * len(value.getbands()) * band_size
+    if isinstance(value, (tuple, list)):
+        return sum(nbytes(item) for item in value)
+    if hasattr(value, '__dict__'):
+        return sys.getsizeof(value) + sum(item.nbytes for item in vars(value).values() if isinstance(item, np.ndarray))
+    return sys.getsizeof(value)
+
+
+class _Pending:
+    """ Result of a computation in progress, awaited by the other threads requesting the same key """
+
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+
+class Cache:
+    """
+    Least recently used cache limited by the total size of the stored values in bytes
+    and optionally by the number of values. It is thread-safe, and a value requested by several threads
+    at once is computed only once: the other threads wait for it. Values larger than the budget
+    are returned, but not stored.
+
+    Attributes:
+    - `namespace` (str): name of the cache in the `caches` registry and statistics
+    - `budget` (int): maximum total size of the keys and values in bytes
+    - `max_entries` (int): maximum number of the stored values, `None` for no limit
+    - `hits`, `misses`, `waits`, `evictions` (int): counters of the requests and the removed values
+    """
+
+    def __init__(self, namespace: str, budget: int, max_entries: int = None):
+        self.namespace = namespace
+        self.budget = budget
+        self.max_entries = max_entries
+        self.hits = self.misses = self.waits = self.evictions = 0
+        self._entries = OrderedDict() # key: (value, size)
+        self._nbytes = 0
+        self._pending = {}
+        self._lock = Lock()
+
+    def get(self, key: Hashable, builder: Callable):
+        """ Returns the cached value for the key, or builds and caches it """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            pending = self._pending.get(key)
+            is_owner = pending is None
+            if is_owner:
+                self.misses += 1
+                pending = self._pending[key] = _Pending()
+            else:
+                self.waits += 1
+        if not is_owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        try:
+            pending.value = builder()
+        except BaseException as error:
+            pending.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+                if pending.error is None:
+                    self._store(key, pending.value)
+            pending.done.set()
+        return pending.value
+
+    def _store(self, key: Hashable, value):
+        """ Adds the value and evicts the least recently used ones to fit the limits, the lock must be held """
+        size = nbytes(key) + nbytes(value)
+        if size > self.budget:
+            return
+        self._entries[key] = (value, size)
+        self._nbytes += size
+        while self._nbytes > self.budget or (self.max_entries is not None and len(self._entries) > self.max_entries):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._nbytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        """ Removes all the stored values, the statistics are kept """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def info(self) -> CacheInfo:
+        """ Returns the statistics of the cache """
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.waits, self.evictions, len(self._entries), self._nbytes, self.budget
+            )
+
+
+# Registry of all the created caches by their namespaces
+caches: dict[str, Cache] = {}
+_caches_lock = Lock()
+
+def get_cache(namespace: str, budget: int, max_entries: int = None) -> Cache:
+    """ Returns the cache of the namespace, creating it with the limits on the first call """
+    with _caches_lock:
+        if namespace not in caches:
+            caches[namespace] = Cache(namespace, budget, max_entries)
+        return caches[namespace]
+
+def cached(namespace: str, budget: int, max_entries: int = None):
+    """
+    Decorator to cache the function results in the namespace, keyed by the arguments as they are passed.
+    As `functools.lru_cache`, the wrapper has `cache_info()`, `cache_clear()` and `__wrapped__`.
+    """
+    cache = get_cache(namespace, budget, max_entries)
+    def decorator(function: Callable):
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+            return cache.get(key, lambda: function(*args, **kwargs))
+        wrapper.cache = cache
+        wrapper.cache_info = cache.info
+        wrapper.cache_clear = cache.clear
+        return update_wrapper(wrapper, function)
+    return decorator
+
+def stats() -> dict[str, CacheInfo]:
+    """ Returns the statistics of all the caches by their namespaces """
+    with _caches_lock:
+        return {namespace: cache.info() for namespace, cache in caches.items()}
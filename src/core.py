@@ -36,22 +36,28 @@ Color:
 - - ColorImage (3D)
 """
 
+from warnings import warn
 from io import BytesIO
-from copy import deepcopy
-from collections.abc import Sequence, Callable
+from copy import copy, deepcopy
+from collections.abc import Sequence, Callable, Mapping
 from typing import Self, ClassVar
 from pathlib import Path
 from functools import lru_cache
+from hashlib import sha1
+from threading import Lock
+from weakref import WeakValueDictionary
+from tempfile import mkstemp
 from traceback import format_exc
+from inspect import getsource
 from PIL import Image
-from scipy.optimize import minimize
-from scipy.linalg import solve
 import numpy as np
 
+import src.data_import as data_import
 from src.data_import import file_reader
 import src.auxiliary as aux
 import src.strings as tr
 import src.image_import as ii
+from src.cache import cached, get_cache
 
 
 
@@ -146,9 +152,15 @@ class ObjectName:
                 name = f'{self.index} {name}'
         return name
 
-    @lru_cache(maxsize=None)
     def __call__(self, lang: str = 'en') -> str:
         """ Returns a string composed of the available attributes """
+        # Memoized per instance, so the names are not kept alive by a global cache
+        try:
+            return self._strings[lang]
+        except AttributeError:
+            self._strings = {}
+        except KeyError:
+            pass
         name = self.indexed_name(lang)
         if self._note_en:
             name = f'{name}: {self.note(lang)}'
@@ -156,8 +168,15 @@ class ObjectName:
             name = f'{name} ({self.info(lang)})'
         if self.reference:
             name = f'{name} [{self.reference}]'
+        self._strings[lang] = name
         return name
 
+    def __getstate__(self) -> dict:
+        """ Excludes the memoized strings from pickling, since the translations may change """
+        state = self.__dict__.copy()
+        state.pop('_strings', None)
+        return state
+
     @staticmethod
     def formatting_provisional_designation(string: str):
         """
@@ -238,6 +257,25 @@ nm_step = 5 # nm
 # Therefore it is disabled by default.
 ignore_sd_for_cubes = True
 
+# Convolution of spectral squares and cubes with filter systems is a matrix multiplication
+# processed in tiles along the spatial axis. The tile size limits the peak memory usage.
+convolution_tile_size = 2**16 # pixels
+
+
+def _convolve_tiled(br: np.ndarray, profiles: np.ndarray) -> np.ndarray:
+    """
+    Returns the convolution of spectral square brightness of shape (nm, pixels)
+    with filter profiles of shape (nm, filters) as an array of shape (filters, pixels).
+    Rectangle integration is computed as a matrix product, tile by tile along the spatial axis.
+    """
+    px_num = br.shape[1]
+    output = np.empty((profiles.shape[1], px_num), dtype=np.result_type(br, profiles, np.float64))
+    profiles_T = nm_step * profiles.T
+    for start in range(0, px_num, convolution_tile_size):
+        end = start + convolution_tile_size
+        np.matmul(profiles_T, br[:, start:end], out=output[:, start:end])
+    return output
+
 
 class _TrueColorToolsObject:
     """ Internal class for inheriting spectral data properties """
@@ -385,17 +423,13 @@ class _TrueColorToolsObject:
                     sd = aux.integrate(sd, nm_step)
                 return Photospectrum(operand2, br, sd, name=operand1.name)
             case (SpectralSquare(), FilterSystem()):
-                br = aux.integrate(operand1.br[:, :, np.newaxis] * operand2.br[:, np.newaxis, :], nm_step).T
+                br = _convolve_tiled(operand1.br, operand2.br)
                 # TODO: uncertainty processing
                 return PhotospectralSquare(operand2, br, name=operand1.name)
             case (SpectralCube(), FilterSystem()):
-                # A loop-less implementation would require a 4D array,
-                # which most computers do not have enough memory for.
-                br = np.empty((len(operand2), *operand1.shape))
-                #for i, profile in enumerate(operand2):
-                for i in range(len(operand2)):
-                    profile = operand2.br[:,i]
-                    br[i] = aux.integrate((operand1.br.T * profile).T, nm_step)
+                # The cube is processed as a square to avoid 4D temporary arrays
+                br = _convolve_tiled(operand1.br.reshape(operand1.nm_len, -1), operand2.br)
+                br = br.reshape(len(operand2), *operand1.shape)
                 # TODO: uncertainty processing
                 return PhotospectralCube(operand2, br, name=operand1.name)
             case _:
@@ -644,9 +678,14 @@ class _SpectralObject(_TrueColorToolsObject):
             # TODO: round the input up to a multiple of 5
             return self.sd[(self.nm >= start) & (self.nm <= end)]
 
-    def define_on_range(self, nm_arr: np.ndarray, crop: bool = False):
-        """ Returns a new SpectralObject with a guarantee of definition on the requested wavelength array """
-        extrapolated = self.__class__(*aux.extrapolating(self.nm, self.br, self.sd, nm_arr, nm_step), name=self.name)
+    def define_on_range(self, nm_arr: np.ndarray, crop: bool = False, statistics: np.ndarray = None):
+        """
+        Returns a new SpectralObject with a guarantee of definition on the requested wavelength array.
+        For a part of a larger object, the extrapolation `statistics` of the whole are used (see `aux.extrapolating()`).
+        """
+        extrapolated = self.__class__(
+            *aux.extrapolating(self.nm, self.br, self.sd, nm_arr, nm_step, statistics=statistics), name=self.name
+        )
         if hasattr(self, 'names'):
             extrapolated.names = self.names
         if crop:
@@ -692,6 +731,62 @@ class _SpectralObject(_TrueColorToolsObject):
             return NotImplemented
 
 
+# Spectra imported from files are stored on the uniform grid as `.npy` sidecar files, so that repeated runs
+# and worker processes skip the parsing. The file name is the hash of the source file path, modification time,
+# size, conversion flags, the processing settings and the processing code (see `spectra_code_hash()`),
+# so the outdated files are never read.
+spectra_cache_folder = Path('.cache/spectra')
+spectra_cache_version = 1
+
+# Byte budget of the in-memory cache of `Spectrum.from_file()`, enough for all the database and filter files
+spectra_file_cache_budget = 64 * 2**20
+
+@lru_cache(maxsize=None)
+def spectra_code_hash() -> str:
+    """
+    Returns the hash of the source code that converts a spectrum file to the uniform grid:
+    the file reader, the resampling, the binning and the unit conversions.
+    """
+    sources = [str(spectra_cache_version)]
+    for code in (
+        data_import, aux, _SpectralObject.from_array, Spectrum.from_file, Spectrum.from_spectral_lines,
+        Spectrum.convert_from_energy_spectral_density_per_frequency,
+        Spectrum.convert_for_photon_counter, Spectrum.convert_from_photon_spectral_density
+    ):
+        try:
+            sources.append(getsource(code))
+        except (OSError, TypeError):
+            pass # the source is not available, the version has to be bumped manually
+    return sha1('\n'.join(sources).encode()).hexdigest()
+
+def spectrum_cache_file(file: str, is_emission: bool, is_filter: bool) -> Path:
+    """ Returns the sidecar file path for the spectrum file, its conversion flags and the processing code """
+    path = Path(file)
+    stat = path.stat()
+    key = f'{spectra_code_hash()} {nm_red_limit} {nm_step} {path.resolve()} {stat.st_mtime_ns} {stat.st_size} {is_emission} {is_filter}'
+    return spectra_cache_folder / f'{sha1(key.encode()).hexdigest()}.npy'
+
+def load_cached_spectrum(cache_file: Path) -> tuple[np.ndarray, np.ndarray, np.ndarray | None] | None:
+    """ Returns the (nm, br, sd) arrays of the sidecar file, or None if it is missing or broken """
+    try:
+        data = np.load(cache_file, allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+    return data[0], data[1], data[2] if data.shape[0] == 3 else None
+
+def save_cached_spectrum(cache_file: Path, spectrum: _SpectralObject):
+    """ Writes the spectrum arrays to the sidecar file, does nothing if it is not possible """
+    rows = (spectrum.nm, spectrum.br) if spectrum.sd is None else (spectrum.nm, spectrum.br, spectrum.sd)
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        # Worker processes and threads may write the same file, so it is replaced atomically
+        descriptor, temp_file = mkstemp(suffix='.tmp', dir=cache_file.parent)
+        with open(descriptor, 'wb') as f:
+            np.save(f, np.stack(rows).astype('float64'))
+        Path(temp_file).replace(cache_file)
+    except OSError:
+        pass # the cache is optional
+
 class Spectrum(_SpectralObject):
     """
     Class to work with a single spectrum (1D SpectralObject).
@@ -723,10 +818,17 @@ class Spectrum(_SpectralObject):
         self.photospectrum: Photospectrum = photospectrum
 
     @staticmethod
-    @lru_cache(maxsize=32)
+    @cached('spectrum_files', spectra_file_cache_budget)
     def from_file(file: str, name: str|ObjectName = None, is_emission: bool = False, is_filter: bool = False):
-        """ Creates a Spectrum object based on loaded data from the specified file """
-        nm, br, sd = file_reader(file)
+        """ Creates a Spectrum object based on loaded data from the specified file or its sidecar cache file """
+        try:
+            cache_file = spectrum_cache_file(file, is_emission, is_filter)
+        except OSError:
+            cache_file = None # the error will be raised by the file reader
+        if cache_file is not None and (cached := load_cached_spectrum(cache_file)) is not None:
+            return Spectrum(*cached, name=name)
+        # Spectral lines are not binned
+        nm, br, sd = file_reader(file, bin_step=None if is_emission else nm_step)
         if is_emission:
             spectrum = Spectrum.from_spectral_lines(nm, br, sd, name=name)
         else:
@@ -739,6 +841,8 @@ class Spectrum(_SpectralObject):
                 spectrum = spectrum.convert_for_photon_counter()
             else:
                 spectrum = spectrum.convert_from_photon_spectral_density()
+        if cache_file is not None:
+            save_cached_spectrum(cache_file, spectrum)
         return spectrum
 
     @staticmethod
@@ -861,7 +965,157 @@ class FilterNotFoundError(Exception):
     def __init__(self, filter_name: str):
         super().__init__(f'Filter "{filter_name}" not found in the "filters" folder.')
 
-@lru_cache(maxsize=32)
+class FilterRegistry:
+    """
+    Index of the filters folder. Scans the folder once, maps the filter names to files
+    and keeps all the normalized edge-zeroed profiles in a compact store: a single array
+    of concatenated profiles with offsets, cached as a `.npz` file and rebuilt if the folder changes.
+    Also provides precomputed mean wavelengths, standard deviations and zero points.
+    """
+
+    def __init__(self, folder: str = 'filters', store_file: str = '.cache/filters.npz'):
+        self.folder = Path(folder)
+        self.store_file = Path(store_file)
+        self._files = None
+        self._store = None
+        self._index = None
+        self._zero_points = {}
+        self._lock = Lock()
+
+    @property
+    def files(self) -> dict[str, Path]:
+        """ Returns the dictionary of filter names and files, sorted by file name """
+        if self._files is None:
+            self._files = {file.stem: file for file in sorted(self.folder.glob('*.*'))}
+        return self._files
+
+    def resolve(self, name: str) -> str:
+        """
+        Returns the full name of the filter. As with the `{name}.*` file search,
+        the name can be a prefix before a dot. If it matches several filters,
+        the first one by file name is used, which is deprecated.
+        """
+        if name in self.files:
+            return name
+        prefix = f'{name}.'
+        matches = [full_name for full_name in self.files if full_name.startswith(prefix)]
+        if len(matches) > 1:
+            warn(
+                f'Filter name "{name}" is ambiguous, it matches {", ".join(matches)}. Using "{matches[0]}".',
+                DeprecationWarning, stacklevel=2
+            )
+        if matches:
+            return matches[0]
+        raise FilterNotFoundError(name)
+
+    def flags(self, name: str) -> dict[str, bool]:
+        """ Returns the profile type flags encoded in the file extension """
+        extension = self.files[name].suffix.upper()
+        return {'photon_counter': 'P' in extension, 'per_frequency': 'J' in extension}
+
+    def signature(self) -> str:
+        """ Returns the hash of the filter names, modification times and sizes """
+        stats = (f'{name} {file.stat().st_mtime_ns} {file.stat().st_size}' for name, file in self.files.items())
+        return sha1('\n'.join(stats).encode()).hexdigest()
+
+    @property
+    def store(self) -> dict[str, np.ndarray]:
+        """ Returns the profiles store, loads or builds it on the first call """
+        with self._lock:
+            if self._store is None:
+                signature = self.signature()
+                try:
+                    with np.load(self.store_file, allow_pickle=False) as data:
+                        store = dict(data)
+                    if str(store['signature']) != signature:
+                        raise ValueError('The filters folder has changed')
+                except (OSError, ValueError, KeyError):
+                    store = self.build_store(signature)
+                self._index = {str(name): i for i, name in enumerate(store['names'])}
+                self._store = store
+            return self._store
+
+    def build_store(self, signature: str) -> dict[str, np.ndarray]:
+        """ Reads all the filter profiles and saves them as a single `.npz` file """
+        names = []
+        starts = []
+        profiles = []
+        for name, file in self.files.items():
+            try:
+                profile = Spectrum.from_file(str(file), name, is_filter=True).edges_zeroed().normalize()
+            except Exception:
+                # The error will be raised by `get_filter()` on the filter request
+                continue
+            names.append(name)
+            starts.append(profile.nm[0])
+            profiles.append(profile)
+        with np.errstate(invalid='ignore'): # for the profiles with negative values, such as the red CMF
+            sd_of_nm = np.array([profile.sd_of_nm() for profile in profiles])
+        store = {
+            'signature': np.array(signature),
+            'names': np.array(names, dtype='str'),
+            'starts': np.array(starts, dtype='int16'),
+            'offsets': np.cumsum([0] + [profile.nm_len for profile in profiles]),
+            'br': np.concatenate([profile.br for profile in profiles]) if profiles else np.empty(0),
+            'mean_nm': np.array([profile.mean_nm() for profile in profiles]),
+            'sd_of_nm': sd_of_nm,
+        }
+        try:
+            self.store_file.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(self.store_file, **store)
+        except OSError:
+            print(f'Filters store "{self.store_file}" could not be saved.')
+            print(f'More precisely, {format_exc(limit=0)}')
+        return store
+
+    def __contains__(self, name: str) -> bool:
+        """ Checks the filter presence in the store """
+        self.store # loading the index
+        return name in self._index
+
+    def profile(self, name: str) -> Spectrum:
+        """ Returns the normalized edge-zeroed filter profile from the store """
+        store = self.store
+        i = self._index[name]
+        br = store['br'][store['offsets'][i]:store['offsets'][i+1]]
+        start = int(store['starts'][i])
+        return Spectrum(aux.grid(start, start + (br.size - 1) * nm_step, nm_step), br, name=name)
+
+    def mean_nm(self, name: str) -> float:
+        """ Returns the precomputed weighted average wavelength of the filter """
+        return self.store['mean_nm'][self._index[name]]
+
+    def sd_of_nm(self, name: str) -> float:
+        """ Returns the precomputed standard deviation of the filter wavelengths """
+        return self.store['sd_of_nm'][self._index[name]]
+
+    def zero_point(self, name: str, system: str = 'Vega') -> float:
+        """
+        Returns the spectral flux density in W / (m² nm) corresponding to zero magnitude
+        in the Vega or AB photometric system. Calculated on the first request.
+        """
+        key = (name, system.lower())
+        if key not in self._zero_points:
+            profile = self.profile(name)
+            match key[1]:
+                case 'vega':
+                    zero_point = (get_vega_SI() @ profile)[0]
+                case 'ab':
+                    # 3631 Jy converted to the spectral flux density per wavelength
+                    ab_SI = 3631e-26 * aux.c / (profile.nm * 1e-9)**2 * 1e-9
+                    zero_point = aux.integrate(profile.br * ab_SI, nm_step)
+                case _:
+                    raise ValueError(f'Photometric system "{system}" is not supported.')
+            self._zero_points[key] = zero_point
+        return self._zero_points[key]
+
+
+filter_registry = FilterRegistry()
+
+# Byte budget of the normalized filter profiles cache
+filters_cache_budget = 16 * 2**20
+
+@cached('filters', filters_cache_budget)
 def get_filter(name: str|int|float) -> Spectrum:
     """
     Creates a scaled to the unit area (normalized) Spectrum object.
@@ -873,11 +1127,10 @@ def get_filter(name: str|int|float) -> Spectrum:
         # "float(name)" checks float input better than
         # "name.isnumeric() or not isinstance(name, str)"
     except ValueError:
-        try:
-            file = str(next(Path('filters').glob(f'{name}.*')))
-            profile = Spectrum.from_file(file, name, is_filter=True)
-        except StopIteration:
-            raise FilterNotFoundError(name)
+        name = filter_registry.resolve(name)
+        if name in filter_registry:
+            return filter_registry.profile(name)
+        profile = Spectrum.from_file(str(filter_registry.files[name]), name, is_filter=True)
     return profile.edges_zeroed().normalize()
 
 
@@ -898,9 +1151,10 @@ class _Square(_TrueColorToolsObject):
     def __getitem__(self, item: slice):
         """ Returns the spatial axis slice """
         if isinstance(item, slice):
-            output = deepcopy(self)
-            output.br = output.br[:,item]
-            output.sd = None if output.sd is None else output.sd[:,item]
+            # Copying of the whole square is avoided, the slice is a view of the brightness array
+            output = copy(self)
+            output.br = self.br[:,item]
+            output.sd = None if self.sd is None else self.sd[:,item]
             return output
 
 
@@ -920,6 +1174,11 @@ class SpectralSquare(_SpectralObject, _Square):
         super().__init__(2, nm, br, sd, name)
 
 
+# Canonical filter systems by the filter names, see `FilterSystem.from_list()`.
+# They are weakly referenced, so the unused ones are freed.
+_interned_filter_systems = WeakValueDictionary()
+_interned_filter_systems_lock = Lock()
+
 class FilterSystem(SpectralSquare):
     """
     Class to work with a set of filters profiles.
@@ -945,15 +1204,26 @@ class FilterSystem(SpectralSquare):
     def from_list(filters: Sequence[str|Spectrum], name: str|ObjectName = None):
         """
         Creates a FilterSystem object from a list of names or profiles.
+        Filter systems created from names only are interned: while one is in use, the same filter names
+        give the same instance (or its shallow copy with another `name`), so the caches keyed
+        on the filter system hit reliably. Their `nm` and `br` arrays are shared and read-only:
+        to modify them, make a copy of the arrays first.
 
         Args:
         - `filters` (Sequence[str|Spectrum]): list of names or profiles (can be mixed)
         - `name` (str|ObjectName): name as a string or an instance of a class that stores its components
         """
+        filters = list(filters)
+        key = None
+        if all(isinstance(profile, str|int|float) for profile in filters):
+            key = tuple(filters)
+            with _interned_filter_systems_lock:
+                filter_system = _interned_filter_systems.get(key)
+            if filter_system is not None:
+                return filter_system._renamed(name)
         # Getting the wavelength info and filter names
         min_arr = []
         max_arr = []
-        filters = list(filters)
         names = []
         for i, profile in enumerate(filters):
             if isinstance(profile, str|int|float):
@@ -967,17 +1237,40 @@ class FilterSystem(SpectralSquare):
         br = np.zeros((len(nm), len(filters)))
         for i, profile in enumerate(filters):
             br[np.where((nm >= min_arr[i]) & (nm <= max_arr[i])), i] = profile.br
-        return FilterSystem(nm, br, name=name, names=tuple(names))
+        filter_system = FilterSystem(nm, br, name=name, names=tuple(names))
+        if key is not None:
+            filter_system.nm.flags.writeable = False
+            filter_system.br.flags.writeable = False
+            with _interned_filter_systems_lock:
+                filter_system = _interned_filter_systems.setdefault(key, filter_system)
+            filter_system = filter_system._renamed(name)
+        return filter_system
+
+    def _renamed(self, name: str|ObjectName) -> Self:
+        """ Returns the filter system, or its shallow copy sharing the arrays if the name differs """
+        name = ObjectName.as_ObjectName(name)
+        if self.name == name:
+            return self
+        output = copy(self)
+        output.name = name
+        return output
 
     def __iter__(self):
         """ Creates an iterator over the filters in the system """
         for i in range(len(self)):
             yield self[i]
 
-    @lru_cache(maxsize=32)
     def __getitem__(self, index: int) -> Spectrum | None:
         """ Returns the filter profile with extra zeros trimmed off """
         if isinstance(index, int):
+            if not self.br.flags.writeable:
+                # Interned filter systems are read-only, so the profiles are memoized per instance
+                try:
+                    return self._profiles[index]
+                except AttributeError:
+                    self._profiles = {}
+                except KeyError:
+                    pass
             profile = self.br[:, index]
             non_zero_indices = np.nonzero(profile)[0]
             start = non_zero_indices[0] - 1
@@ -986,7 +1279,10 @@ class FilterSystem(SpectralSquare):
                 name = self.names[index]
             except IndexError:
                 name = None
-            return Spectrum(self.nm[start:end], profile[start:end], name=name)
+            spectrum = Spectrum(self.nm[start:end], profile[start:end], name=name)
+            if not self.br.flags.writeable:
+                self._profiles[index] = spectrum
+            return spectrum
 
 
 class _Cube(_TrueColorToolsObject):
@@ -1003,15 +1299,26 @@ class _Cube(_TrueColorToolsObject):
             output.sd = aux.spatial_downscaling(self.sd, pixels_limit)
         return output
 
-    def flatten(self):
-        """ Returns a (photo)spectral square with linearized spatial axis """
-        br = self.br.reshape(self.nm_len, self.size)
-        sd = None if self.sd is None else self.br.reshape(self.nm_len, self.size)
+    def flatten(self, mask: np.ndarray = None):
+        """
+        Returns a (photo)spectral square with linearized spatial axis.
+        With the boolean spatial `mask`, only the selected pixels are included, in the row-major order.
+        """
+        if mask is None:
+            br = self.br.reshape(self.nm_len, self.size)
+            sd = None if self.sd is None else self.sd.reshape(self.nm_len, self.size)
+        else:
+            br = self.br[:, mask]
+            sd = None if self.sd is None else self.sd[:, mask]
         if isinstance(self, _SpectralObject):
             return SpectralSquare(self.nm, br, sd, self.name)
         elif isinstance(self, _PhotospectralObject):
             return PhotospectralSquare(self.filter_system, br, sd, self.name)
 
+    def background_mask(self, threshold: float = 0.) -> np.ndarray:
+        """ Returns the boolean spatial mask of the pixels with all the values not exceeding the threshold """
+        return self.br.max(axis=0) <= threshold
+
     @property
     def width(self):
         """ Returns horizontal spatial axis length """
@@ -1051,6 +1358,154 @@ class SpectralCube(_SpectralObject, _Cube):
         return SpectralCube.from_array(*ii.cube_reader(file))
 
 
+class LazySpectralCube:
+    """
+    Spectral cube stored in a file and read on demand, for cubes that do not fit into memory.
+    The data is resampled to the uniform grid only for the requested rows, see `SpectralCube.from_array()`.
+
+    Attributes:
+    - `nm` (np.ndarray): spectral axis of the file, on an arbitrary grid
+    - `br` (np.ndarray): memory-mapped array of "brightness" of shape (nm, width, height)
+    - `name` (ObjectName): name as an instance of a class that stores its components
+    - `width` (int): horizontal spatial axis length
+    - `height` (int): vertical spatial axis length
+    - `size` (int): number of pixels
+    """
+
+    def __init__(self, nm: np.ndarray, br: np.ndarray, name: str | ObjectName = None):
+        self.nm = nm
+        self.br = br
+        self.name = ObjectName.as_ObjectName(name)
+
+    @staticmethod
+    def from_file(file: str):
+        """ Opens the spectral cube file as a memory map """
+        return LazySpectralCube(*ii.cube_memmap_reader(file), name=Path(file).stem)
+
+    @property
+    def width(self):
+        """ Returns horizontal spatial axis length """
+        return self.br.shape[1]
+
+    @property
+    def height(self):
+        """ Returns vertical spatial axis length """
+        return self.br.shape[2]
+
+    @property
+    def size(self):
+        """ Returns the number of pixels """
+        return self.width * self.height
+
+    def read_rows(self, rows: slice) -> np.ndarray:
+        """ Loads the brightness of the range of rows, array of shape (nm, width, rows) """
+        return np.array(self.br[:, :, rows], dtype='float64')
+
+    def to_square(self, br: np.ndarray) -> SpectralSquare:
+        """ Creates a SpectralSquare on the uniform grid from the loaded brightness of shape (nm, pixels) """
+        return SpectralSquare.from_array(self.nm, br, name=self.name)
+
+    def downscale(self, pixels_limit: int) -> SpectralCube:
+        """ Loads the spectral cube with the spatial resolution approximately matching the number of pixels """
+        return SpectralCube.from_array(self.nm, aux.spatial_downscaling(self.br, pixels_limit), name=self.name)
+
+
+# Hundreds of database photospectra share the same filter systems, and the image processing repeats
+# the reconstruction for each preview. Since the Tikhonov regularization matrices depend only on the filter
+# profiles and the requested wavelength range, the reconstruction operators are cached.
+reconstruction_cache_budget = 64 * 2**20
+_reconstruction_cache = get_cache('reconstruction', reconstruction_cache_budget)
+
+def _filter_system_key(filter_system: FilterSystem) -> tuple:
+    """ Returns a hashable representation of the filter profiles content """
+    try:
+        return filter_system._content_key
+    except AttributeError:
+        key = (filter_system.br.shape, filter_system.nm.tobytes(), filter_system.br.tobytes())
+        if not filter_system.br.flags.writeable:
+            # Interned filter systems are read-only, so the key can be stored
+            filter_system._content_key = key
+        return key
+
+def reconstruction_operator(filter_system: FilterSystem, nm_arr: np.ndarray):
+    """
+    Returns the (cached) spectral reconstruction data for the filter system and the wavelength array:
+    - `nm` (np.ndarray): wavelength grid of the reconstructed spectrum
+    - `A` (np.ndarray): matrix of the Tikhonov-regularized quadratic problem
+    - `T_T` (np.ndarray): transposed filter profiles matrix, `b = T_T @ br` is the right-hand side
+    - `operator` (np.ndarray): precomputed `A⁻¹Tᵀ`, reconstructs a spectrum with a matrix-vector product
+    - `A_inv_diag` (np.ndarray): diagonal of `A⁻¹`, needed for the confidence band estimation
+
+    The key is the content of the filter system and the edges of the wavelength array,
+    since the extrapolation depends only on them.
+    """
+    def builder():
+        fs = filter_system.define_on_range(nm_arr)
+        T = fs.br.T * nm_step
+        #L = aux.smoothness_matrix(T.shape[1], order=2)
+        #A = T.T @ T + 0.05 * L.T @ L
+        # int8 matrix multiplication is not BLAS-backed and is much slower than float64
+        L1 = aux.smoothness_matrix(T.shape[1], order=1).astype('float64')
+        L2 = aux.smoothness_matrix(T.shape[1], order=2).astype('float64')
+        # TODO: research on some known spectra to find which ratios (0.005, 1) fit best
+        A = aux.covar_matrix(T) + 0.005 * aux.covar_matrix(L1) + 1 * aux.covar_matrix(L2)
+        # A is symmetric positive definite (the filter profiles are non-zero on a constant spectrum)
+        from scipy.linalg import cho_factor, cho_solve # lazy import for the faster startup
+        A_factorized = cho_factor(A)
+        operator = cho_solve(A_factorized, T.T)
+        A_inv_diag = np.diag(cho_solve(A_factorized, np.eye(A.shape[0])))
+        output = (fs.nm, A, T.T, operator, A_inv_diag)
+        for arr in output:
+            arr.flags.writeable = False # shared between the calls
+        return output
+    return _reconstruction_cache.get((*_filter_system_key(filter_system), int(nm_arr[0]), int(nm_arr[-1])), builder)
+
+
+def _refine_reconstruction(
+        br0: np.ndarray, sd0: np.ndarray | None, br1: np.ndarray,
+        A: np.ndarray, T_T: np.ndarray, operator: np.ndarray, A_inv_diag: np.ndarray
+    ):
+    """
+    Post-processing of a reconstructed single spectrum: non-negativity and confidence band.
+    Returns the spectrum brightness and its standard deviation (or `None`).
+    """
+    sd1 = None
+    if br1.min() < 0:
+        # To avoid negative spectra, a lower bound is set and iterative
+        # optimization is performed using quadratic programming methods.
+        # The processing speed drops by a factor of about five,
+        # so the use is blocked for spectral squares and cubes:
+        # background noise near zero can be most of the pixels.
+        from scipy.optimize import minimize # lazy import for the faster startup
+        b = T_T @ br0
+        def objective(Y):
+            # Tikhonov-regularized quadratic objective: 0.5 * Y^T A Y - b^T Y
+            return 0.5 * Y @ A @ Y - b @ Y
+        def gradient(Y):
+            # Gradient of the objective
+            return A @ Y - b
+        bounds = ((0, None) for _ in range(A.shape[1]))
+        result = minimize(
+            fun=objective,
+            x0=np.maximum(br1, 0),
+            jac=gradient,
+            bounds=bounds,
+            method='L-BFGS-B',
+        )
+        if not result.success:
+            raise ValueError(f'Optimization failed: {result.message}')
+        br1 = result.x
+    if sd0 is not None:
+        # Measurement confidence band calculation
+        # Confidence bands for spectral squares and cubes are not computed to save computational resources
+        # diag(A⁻¹ Tᵀ diag(sd0²) T A⁻¹) is a matrix-vector product for the precomputed operator
+        sd1 = np.sqrt(operator**2 @ sd0**2)
+        # An attempt to account for the sensitivity confidence band of the method
+        sd1 = np.sqrt(sd1**2 + (0.01 * np.median(br1))**2 * A_inv_diag)
+        # TODO: needs research, `0.01 * np.median(br1)` sd scale factor selected manually
+    return br1, sd1
+
+
 class _PhotospectralObject(_TrueColorToolsObject):
     """
     Internal parent class for Photospectrum (1D), PhotospectralSquare (2D) and PhotospectralCube (3D).
@@ -1096,7 +1551,7 @@ class _PhotospectralObject(_TrueColorToolsObject):
     @classmethod
     def stub(cls, name=None):
         """ Initializes an object in case of the data problems """
-        return cls(stub_filter_system, np.zeros((2, 1, 1)[:cls.ndim]), name=name)
+        return cls(get_stub_filter_system(), np.zeros((2, 1, 1)[:cls.ndim]), name=name)
 
     @property
     def nm(self) -> np.ndarray[np.integer]:
@@ -1150,73 +1605,42 @@ class _PhotospectralObject(_TrueColorToolsObject):
             if len(self.filter_system) == 1: # single-point PhotospectralObject support
                 nm1, br1 = aux.extrapolating(nm0, br0, sd0, nm_arr, nm_step)
             else:
-                filter_system = self.filter_system.define_on_range(nm_arr)
-                nm1 = filter_system.nm
-                T = filter_system.br.T * nm_step
-                #L = aux.smoothness_matrix(T.shape[1], order=2)
-                #A = T.T @ T + 0.05 * L.T @ L
-                L1 = aux.smoothness_matrix(T.shape[1], order=1)
-                L2 = aux.smoothness_matrix(T.shape[1], order=2)
-                # TODO: research on some known spectra to find which ratios (0.005, 1) fit best
-                A = aux.covar_matrix(T) + 0.005 * aux.covar_matrix(L1) + 1 * aux.covar_matrix(L2)
+                nm1, A, T_T, operator, A_inv_diag = reconstruction_operator(self.filter_system, nm_arr)
                 if self.ndim == 3:
-                    # scipy supports batch mode for 2d arrays, but not for 3D arrays
-                    br0 = br0.reshape(T.shape[0], -1)
-                b = T.T @ br0
-                br1 = solve(A, b) # x1.5 faster than np.linalg.inv(A) @ b
+                    # matrix multiplication is defined for 2D arrays, not for 3D arrays
+                    br0 = br0.reshape(T_T.shape[1], -1)
+                br1 = operator @ br0 # equivalent to `solve(A, T_T @ br0)`
                 if self.ndim == 3:
                     # Reshape spectral cube back from square
                     br1 = br1.reshape(-1, *self.br.shape[1:])
-                if self.ndim == 1 and br1.min() < 0:
-                    # To avoid negative spectra, a lower bound is set and iterative
-                    # optimization is performed using quadratic programming methods.
-                    # The processing speed drops by a factor of about five,
-                    # so the use is blocked for spectral squares and cubes:
-                    # background noise near zero can be most of the pixels.
-                    def objective(Y):
-                        # Tikhonov-regularized quadratic objective: 0.5 * Y^T A Y - b^T Y
-                        return 0.5 * Y @ A @ Y - b @ Y
-                    def gradient(Y):
-                        # Gradient of the objective
-                        return A @ Y - b
-                    bounds = ((0, None) for _ in range(A.shape[1]))
-                    result = minimize(
-                        fun=objective,
-                        x0=np.maximum(br1, 0),
-                        jac=gradient,
-                        bounds=bounds,
-                        method='L-BFGS-B',
-                    )
-                    if not result.success:
-                        raise ValueError(f'Optimization failed: {result.message}')
-                    br1 = result.x
-                if self.ndim == 1 and sd0 is not None:
-                    # Measurement confidence band calculation
-                    # Confidence bands for spectral squares and cubes are not computed to save computational resources
-                    A_inv = np.linalg.inv(A)
-                    sd1 = np.sqrt(np.diag(A_inv @ T.T @ np.diag(sd0**2) @ T @ A_inv))
-                    # An attempt to account for the sensitivity confidence band of the method
-                    sd1 = np.sqrt(sd1**2 + (0.01 * np.median(br1))**2 * np.diag(A_inv))
-                    # TODO: needs research, `0.01 * np.median(br1)` sd scale factor selected manually
-            if self.ndim == 1:
-                # Retain the photometric data for the resulting spectral object.
-                spectral_obj = Spectrum(nm1, br1, sd1, name=self.name, photospectrum=deepcopy(self))
-            else:
-                # It may be too costly to retain photometry for spectral squares and cubes.
-                spectral_obj = target_class(nm1, br1, sd1, name=self.name)
-            if crop:
-                start = max(nm1[0], nm_arr[0])
-                end = min(nm1[-1], nm_arr[-1])
-                spectral_obj.br = spectral_obj.get_br_in_range(start, end)
-                spectral_obj.sd = spectral_obj.get_sd_in_range(start, end)
-                spectral_obj.nm = aux.grid(start, end, nm_step)
-            return spectral_obj
+                if self.ndim == 1:
+                    br1, sd1 = _refine_reconstruction(br0, sd0, br1, A, T_T, operator, A_inv_diag)
+            return self._reconstructed(target_class, nm1, br1, sd1, nm_arr, crop)
         except ZeroDivisionError:
             print(f'# Note for the PhotospectralObject "{self.name}"')
             print(f'- Something unexpected happened in spectral reconstruction to {target_class.__name__}. It was replaced by a stub.')
             print(f'- More precisely, {format_exc(limit=0).strip()}')
             return target_class.stub(self.name)
 
+    def _reconstructed(
+            self, target_class: type, nm1: np.ndarray, br1: np.ndarray, sd1: np.ndarray,
+            nm_arr: np.ndarray, crop: bool, retain_photometry: bool = True
+        ):
+        """ Packs the reconstruction result into a SpectralObject, optionally cropped to the wavelength array """
+        if self.ndim == 1 and retain_photometry:
+            # Retain the photometric data for the resulting spectral object.
+            spectral_obj = Spectrum(nm1, br1, sd1, name=self.name, photospectrum=deepcopy(self))
+        else:
+            # It may be too costly to retain photometry for spectral squares and cubes.
+            spectral_obj = target_class(nm1, br1, sd1, name=self.name)
+        if crop:
+            start = max(nm1[0], nm_arr[0])
+            end = min(nm1[-1], nm_arr[-1])
+            spectral_obj.br = spectral_obj.get_br_in_range(start, end)
+            spectral_obj.sd = spectral_obj.get_sd_in_range(start, end)
+            spectral_obj.nm = aux.grid(start, end, nm_step)
+        return spectral_obj
+
     def apply_element_wise_operation(self, other: _TrueColorToolsObject, br_handling: Callable, sd_handling: Callable) -> Self:
         """
         Returns a new PhotospectralObject formed from element-wise operation with
@@ -1236,7 +1660,13 @@ class _PhotospectralObject(_TrueColorToolsObject):
         return higher_dim.__class__(filter_system, br, sd, name=higher_dim.name)
 
 
-stub_filter_system = FilterSystem.from_list(('Generic_Bessell.B', 'Generic_Bessell.V'))
+# The constants below that require loading of data files are initialized lazily on the first call,
+# and are also available as module attributes (e.g. `core.sun_norm`) for backward compatibility.
+
+@lru_cache(maxsize=None)
+def get_stub_filter_system() -> FilterSystem:
+    """ Returns the filter system of photospectral stub objects """
+    return FilterSystem.from_list(('Generic_Bessell.B', 'Generic_Bessell.V'))
 
 class Photospectrum(_PhotospectralObject):
     """
@@ -1293,6 +1723,40 @@ class PhotospectralCube(_PhotospectralObject, _Cube):
 
 
 
+def reconstruct_batch(
+        objects: Sequence[_TrueColorToolsObject], nm_arr: np.ndarray,
+        crop: bool = False, retain_photometry: bool = True
+    ) -> list[_SpectralObject]:
+    """
+    Returns a list of SpectralObjects defined on the wavelength array, equivalent to calling
+    `define_on_range()` for each object, but photospectra of the same filter system are
+    reconstructed together with one matrix product instead of one per object.
+
+    Spectra storing the pre-reconstructed data are treated as photospectra.
+    Copying of the photometric data into the batch-reconstructed spectra can be disabled
+    with `retain_photometry=False` if the spectra are intermediate results.
+    """
+    output = [None] * len(objects)
+    groups = {}
+    for n, obj in enumerate(objects):
+        photospectrum = obj.photospectrum if isinstance(obj, Spectrum) else obj
+        if isinstance(photospectrum, Photospectrum) and len(photospectrum.filter_system) > 1:
+            groups.setdefault(_filter_system_key(photospectrum.filter_system), []).append((n, photospectrum))
+        else:
+            output[n] = obj.define_on_range(nm_arr, crop)
+    for group in groups.values():
+        nm1, A, T_T, operator, A_inv_diag = reconstruction_operator(group[0][1].filter_system, nm_arr)
+        # Each column is a right-hand side of the same Tikhonov problem
+        br1_matrix = operator @ np.column_stack([photospectrum.br for _, photospectrum in group])
+        for (n, photospectrum), br1 in zip(group, br1_matrix.T):
+            try:
+                br1, sd1 = _refine_reconstruction(photospectrum.br, photospectrum.sd, br1, A, T_T, operator, A_inv_diag)
+                output[n] = photospectrum._reconstructed(Spectrum, nm1, br1, sd1, nm_arr, crop, retain_photometry)
+            except ZeroDivisionError:
+                output[n] = photospectrum.define_on_range(nm_arr, crop) # to get the same logs and stub
+    return output
+
+
 # ------------ Phase Photometry Section ------------
 
 class _PhotometricModel:
@@ -1607,16 +2071,44 @@ class ReflectingBody:
                     return self.unscaled, None
 
 
-sun_SI = Spectrum.from_file('spectra/files/CALSPEC/sun_reference_stis_002.fits', name='Sun') # W / (m² nm)
-sun_SI.sd = None # removing uncertainty to facilitate calculations and simplify spectrum plots
-sun_in_V, _ = sun_SI @ get_filter('Generic_Bessell.V')
-sun_norm = sun_SI.scaled_at(get_filter('Generic_Bessell.V'))
-sun_filter = sun_SI.normalize()
+@lru_cache(maxsize=None)
+def get_sun_SI() -> Spectrum:
+    """ Returns the solar spectrum in W / (m² nm) """
+    sun_SI = Spectrum.from_file('spectra/files/CALSPEC/sun_reference_stis_002.fits', name='Sun')
+    sun_SI.sd = None # removing uncertainty to facilitate calculations and simplify spectrum plots
+    return sun_SI
+
+@lru_cache(maxsize=None)
+def get_sun_in_V() -> float:
+    """ Returns the solar spectral flux density in the V filter """
+    return (get_sun_SI() @ get_filter('Generic_Bessell.V'))[0]
 
-vega_SI = Spectrum.from_file('spectra/files/CALSPEC/alpha_lyr_stis_011.fits', name='Vega') # W / (m² nm)
-vega_SI.sd = None # removing uncertainty to facilitate calculations and simplify spectrum plots
-vega_in_V, _ = vega_SI @ get_filter('Generic_Bessell.V')
-vega_norm = vega_SI.scaled_at(get_filter('Generic_Bessell.V'))
+@lru_cache(maxsize=None)
+def get_sun_norm() -> Spectrum:
+    """ Returns the solar spectrum scaled to unity in the V filter """
+    return get_sun_SI().scaled_at(get_filter('Generic_Bessell.V'))
+
+@lru_cache(maxsize=None)
+def get_sun_filter() -> Spectrum:
+    """ Returns the solar spectrum normalized to the unit area """
+    return get_sun_SI().normalize()
+
+@lru_cache(maxsize=None)
+def get_vega_SI() -> Spectrum:
+    """ Returns the Vega spectrum in W / (m² nm) """
+    vega_SI = Spectrum.from_file('spectra/files/CALSPEC/alpha_lyr_stis_011.fits', name='Vega')
+    vega_SI.sd = None # removing uncertainty to facilitate calculations and simplify spectrum plots
+    return vega_SI
+
+@lru_cache(maxsize=None)
+def get_vega_in_V() -> float:
+    """ Returns the Vega spectral flux density in the V filter """
+    return (get_vega_SI() @ get_filter('Generic_Bessell.V'))[0]
+
+@lru_cache(maxsize=None)
+def get_vega_norm() -> Spectrum:
+    """ Returns the Vega spectrum scaled to unity in the V filter """
+    return get_vega_SI().scaled_at(get_filter('Generic_Bessell.V'))
 
 
 def _create_TCT_object(
@@ -1642,15 +2134,19 @@ def _create_TCT_object(
     if calib is not None:
         match calib.lower():
             case 'vega':
-                TCT_obj *= vega_norm
+                TCT_obj *= get_vega_norm()
             case 'ab':
                 TCT_obj = TCT_obj.convert_from_energy_spectral_density_per_frequency()
             case _:
                 pass
     if is_sun:
-        TCT_obj /= sun_norm
+        TCT_obj /= get_sun_norm()
     return TCT_obj
 
+def file_spectrum(file: str, is_emission: bool = False) -> Spectrum:
+    """ Returns the spectrum of the file referenced in the database, with the same cache key for all the callers """
+    return Spectrum.from_file(file, name=file, is_emission=is_emission)
+
 def database_parser(name: ObjectName, content: dict) -> EmittingBody | ReflectingBody:
     """
     Depending on the contents of the object read from the database, returns a class that has `get_spectrum()` method.
@@ -1692,7 +2188,7 @@ def database_parser(name: ObjectName, content: dict) -> EmittingBody | Reflectin
     is_emission = 'is_emission_spectrum' in content and content['is_emission_spectrum']
     if 'file' in content:
         try:
-            imported_spectrum = Spectrum.from_file(content['file'], name=content['file'], is_emission=is_emission)
+            imported_spectrum = file_spectrum(content['file'], is_emission)
             is_emission = False
         except Exception:
             imported_spectrum = Spectrum.stub()
@@ -1825,7 +2321,7 @@ def database_parser(name: ObjectName, content: dict) -> EmittingBody | Reflectin
             if sphe_where is not None and sphe_how is not None:
                 spherical = geometric.scaled_at(sphe_where, sphe_how)
             elif 'bond_albedo' in content:
-                spherical = geometric.scaled_at(sun_filter, *aux.parse_value_sd(content['bond_albedo']))
+                spherical = geometric.scaled_at(get_sun_filter(), *aux.parse_value_sd(content['bond_albedo']))
         if 'br_spherical' in content:
             br_sphe, sd_sphe = aux.parse_value_sd_list(content['br_spherical'])
             if 'sd_spherical' in content:
@@ -1848,7 +2344,7 @@ def database_parser(name: ObjectName, content: dict) -> EmittingBody | Reflectin
         elif sphe_where is not None and sphe_how is not None:
             spherical = TCT_obj.scaled_at(sphe_where, sphe_how)
         elif 'bond_albedo' in content:
-            spherical = TCT_obj.scaled_at(sun_filter, *aux.parse_value_sd(content['bond_albedo']))
+            spherical = TCT_obj.scaled_at(get_sun_filter(), *aux.parse_value_sd(content['bond_albedo']))
     #tags = set()
     #if 'tags' in content:
     #    for tag in content['tags']:
@@ -1872,8 +2368,13 @@ def database_parser(name: ObjectName, content: dict) -> EmittingBody | Reflectin
 # CIE 1931 XYZ color matching functions, 2-deg
 # https://cie.co.at/datatable/cie-1931-colour-matching-functions-2-degree-observer
 # http://www.cvrl.org/cie.htm
-xyz_cmf = FilterSystem.from_list(('CIE_1931_2deg.x', 'CIE_1931_2deg.y', 'CIE_1931_2deg.z'))
-visible_range = xyz_cmf.nm # original CMF definition range is 360-830 nm
+@lru_cache(maxsize=None)
+def get_xyz_cmf() -> FilterSystem:
+    """ Returns the CIE 1931 XYZ color matching functions """
+    return FilterSystem.from_list(('CIE_1931_2deg.x', 'CIE_1931_2deg.y', 'CIE_1931_2deg.z'))
+
+visible_range = get_xyz_cmf().nm # original CMF definition range is 360-830 nm
+
 #visible_range = aux.grid(380, 730, 5) # for values greater than 0.001, saves 27% of memory used
 #xyz_cmf = xyz_cmf.define_on_range(visible_range)
 
@@ -1896,6 +2397,29 @@ matrix_B_inv = np.array((
 ))
 
 
+class _LazyDict(Mapping):
+    """
+    Read-only dictionary with values given as functions to be computed on the first access.
+    All the accessors, including `get()`, `values()` and `items()`, go through `__getitem__()`.
+    """
+
+    def __init__(self, data: dict):
+        self._data = dict(data)
+
+    def __getitem__(self, key):
+        value = self._data[key]
+        if callable(value):
+            value = value()
+            self._data[key] = value
+        return value
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+
 class ColorSystem:
     """
     This class builds and stores RGB to XYZ (and inverse) transformation matrices.
@@ -1955,7 +2479,7 @@ class ColorSystem:
     @staticmethod
     def spectrum_to_white_point(spectrum: Spectrum) -> np.ndarray:
         """ Returns (x, y) coordinates of the spectrum on the chromaticity diagram """
-        xyz = (spectrum @ xyz_cmf).br
+        xyz = (spectrum @ get_xyz_cmf()).br
         return xyz[:2] / xyz.sum()
 
     # Values are color primaries (red, green, blue) and white points used.
@@ -1973,9 +2497,9 @@ class ColorSystem:
         'UHDTV': (((0.708, 0.292), (0.170, 0.797), (0.13, 0.046)), 'Illuminant D65'),
     }
 
-    # Values are (x, y) coordinates.
+    # Values are (x, y) coordinates. White points of the spectra are calculated on the first access.
     # https://en.wikipedia.org/wiki/Standard_illuminant#White_points_of_standard_illuminants
-    supported_white_points = {
+    supported_white_points = _LazyDict({
         'Illuminant A': (0.44758, 0.40745),
         'Illuminant B': (0.34842, 0.35161),
         'Illuminant C': (0.31006, 0.31616),
@@ -1985,14 +2509,150 @@ class ColorSystem:
         'Illuminant D75': (0.29902, 0.31485),
         'Illuminant D93': (0.28315, 0.29711),
         'Illuminant E': (1/3, 1/3),
-        'Vega': spectrum_to_white_point(vega_SI),
-        'Sun': spectrum_to_white_point(sun_SI),
-    }
+        'Vega': lambda: ColorSystem.spectrum_to_white_point(get_vega_SI()),
+        'Sun': lambda: ColorSystem.spectrum_to_white_point(get_sun_SI()),
+    })
 
 
 xyz_color_system = ColorSystem('CIE 1931 XYZ', 'Illuminant E')
 
 
+def color_kernel(filter_system: FilterSystem) -> np.ndarray:
+    """
+    Returns the (cached) 3×N matrix converting N-band photometry into CIE 1931 XYZ.
+
+    Without the non-negativity optimization, the spectral reconstruction and the convolution
+    with the color matching functions are linear, so they are fused into a single matrix.
+    Per-band factors (such as photon spectral density conversion) can be folded into the columns.
+    """
+    def builder():
+        xyz_cmf = get_xyz_cmf()
+        if len(filter_system) == 1:
+            # Single-point photometry is extrapolated as an equal-energy spectrum
+            kernel = np.atleast_2d(aux.integrate(xyz_cmf.br, nm_step)).T
+        else:
+            nm1, _, _, operator, _ = reconstruction_operator(filter_system, xyz_cmf.nm)
+            kernel = nm_step * xyz_cmf.br.T @ operator[(nm1 >= xyz_cmf.nm[0]) & (nm1 <= xyz_cmf.nm[-1])]
+        kernel.flags.writeable = False # shared between the calls
+        return kernel
+    return _reconstruction_cache.get(('XYZ', *_filter_system_key(filter_system)), builder)
+
+
+# Blackbody colors lookup table
+
+# Planck's law satisfies B(sλ, T) = s⁻⁵ B(λ, sT). Therefore, the XYZ color and V-band radiance of a blackbody
+# with the wavelengths scaled by the redshifts factor s are s⁻⁵ times the ones of the blackbody with the temperature sT,
+# and a one-dimensional table over the temperature is sufficient for all the redshifts.
+blackbody_table_file = Path('.cache/blackbody.npz')
+blackbody_table_log_range = (2., 7.) # decimal logarithm of temperature in K, computed exactly outside
+blackbody_table_size = 4096
+
+def blackbody_redshift_factor(velocity: float|np.ndarray = 0., vII: float|np.ndarray = 0.) -> np.ndarray:
+    """
+    Returns the wavelength scale factor for the Doppler (radial velocity in units of c)
+    and gravitational (escape velocity in units of c) redshifts. Zero for the limiting velocities of 1.
+    """
+    velocity = np.asarray(velocity, dtype='float64')
+    vII = np.asarray(vII, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.sqrt((1 - velocity) / (1 + velocity)) * np.exp(-vII * vII / 2)
+    return np.where((np.abs(velocity) == 1) | (vII == 1), 0., factor)
+
+def _blackbody_photometry(temperature: np.ndarray) -> np.ndarray:
+    """
+    Returns the exact XYZ colors and V-band radiance of blackbodies, an array of shape (N, 4).
+    Planck's law is evaluated on the (temperatures, wavelengths) grid and convolved as a matrix product, in tiles.
+    """
+    xyz_cmf = get_xyz_cmf()
+    v_filter = get_filter('Generic_Bessell.V')
+    nm = aux.grid(min(xyz_cmf.nm[0], v_filter.nm[0]), max(xyz_cmf.nm[-1], v_filter.nm[-1]), nm_step)
+    # Both profiles have zeroed edges and therefore are not extrapolated in convolution
+    profiles = np.zeros((nm.size, 4))
+    start = (xyz_cmf.nm[0] - nm[0]) // nm_step
+    profiles[start:start+xyz_cmf.nm_len, :3] = xyz_cmf.br
+    start = (v_filter.nm[0] - nm[0]) // nm_step
+    profiles[start:start+v_filter.nm_len, 3] = v_filter.br
+    temperature = np.asarray(temperature, dtype='float64')
+    output = np.empty((temperature.size, 4))
+    for start in range(0, temperature.size, convolution_tile_size):
+        end = start + convolution_tile_size
+        with np.errstate(over='ignore', divide='ignore'): # zero radiance for extremely low temperatures
+            br = aux.planck_radiance(nm, temperature[start:end, np.newaxis])
+        output[start:end] = nm_step * (br @ profiles)
+    return output
+
+@lru_cache(maxsize=None)
+def get_blackbody_table() -> np.ndarray:
+    """
+    Returns the decimal logarithm of the XYZ colors and V-band radiance of blackbodies, an array of shape (size, 4)
+    on a uniform grid of the temperature logarithm. Loads the table from disk or computes and saves it.
+    """
+    signature = f'{filter_registry.signature()} {blackbody_table_log_range} {blackbody_table_size}'
+    try:
+        with np.load(blackbody_table_file, allow_pickle=False) as data:
+            if str(data['signature']) != signature:
+                raise ValueError('The table parameters have changed')
+            return data['table']
+    except (OSError, ValueError, KeyError):
+        temperature = np.logspace(*blackbody_table_log_range, blackbody_table_size)
+        table = np.log10(_blackbody_photometry(temperature))
+        try:
+            blackbody_table_file.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(blackbody_table_file, signature=np.array(signature), table=table)
+        except OSError:
+            print(f'Blackbody table "{blackbody_table_file}" could not be saved.')
+            print(f'More precisely, {format_exc(limit=0)}')
+        return table
+
+def blackbody_redshift_photometry(
+        temperature: float|np.ndarray, velocity: float|np.ndarray = 0., vII: float|np.ndarray = 0., exact: bool = False
+    ) -> np.ndarray:
+    """
+    Returns XYZ colors and V-band radiance of redshifted blackbodies (see `Spectrum.from_blackbody_redshift()`),
+    an array of shape (..., 4) for the broadcast input. Interpolates the precomputed table, unless `exact` is set,
+    effective temperatures outside of it are computed exactly.
+    """
+    factor = blackbody_redshift_factor(velocity, vII)
+    temperature, factor = np.broadcast_arrays(np.asarray(temperature, dtype='float64'), factor)
+    effective_temperature = temperature * factor
+    output = np.zeros((*effective_temperature.shape, 4))
+    is_physical = effective_temperature > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_temperature = np.log10(effective_temperature)
+    start, end = blackbody_table_log_range
+    in_table = is_physical & (log_temperature >= start) & (log_temperature <= end) & (not exact)
+    if np.any(in_table):
+        table = get_blackbody_table()
+        position = (log_temperature[in_table] - start) / (end - start) * (blackbody_table_size - 1)
+        index = np.minimum(position.astype('int'), blackbody_table_size - 2)
+        weight = (position - index)[:, np.newaxis]
+        output[in_table] = 10**((1 - weight) * table[index] + weight * table[index+1])
+    if np.any(outside := is_physical & ~in_table):
+        output[outside] = _blackbody_photometry(effective_temperature[outside])
+    output[is_physical] *= factor[is_physical, np.newaxis]**-5
+    return output
+
+def blackbody_redshift_colors(
+        temperature: float|np.ndarray, velocity: float|np.ndarray = 0., vII: float|np.ndarray = 0.,
+        color_system: ColorSystem = None, radiance: bool = False, exact: bool = True
+    ) -> np.ndarray | tuple[np.ndarray, np.ndarray]:
+    """
+    Batch version of the color calculation of `Spectrum.from_blackbody_redshift()` for arrays of parameters,
+    for example, to render the Planckian locus or temperature ramps.
+    Returns the colors as an array of shape (N, 3) in XYZ or in the color system if specified
+    (not postprocessed, see `ColorObject.to_array()`) and, if `radiance` is set, the V-band radiance array of shape (N).
+    The table interpolation is used instead of the exact calculation with `exact=False`.
+    """
+    photometry = blackbody_redshift_photometry(temperature, velocity, vII, exact).reshape(-1, 4)
+    colors = photometry[:, :3]
+    if color_system is not None:
+        colors = ColorLine(colors.T, xyz_color_system).to_color_system(color_system).br.T
+    if radiance:
+        return colors, photometry[:, 3]
+    return colors
+
+
+
 class ColorObject:
     """
     This class stores a color brightness array (`self.br`) with values in the 0-1 range,
@@ -2020,7 +2680,15 @@ class ColorObject:
     @classmethod
     def from_spectral_data(cls, data: _TrueColorToolsObject) -> Self:
         """ Convolves (photo)spectrum with CIE 1931 XYZ color matching functions """
-        return cls((data @ xyz_cmf).br, xyz_color_system)
+        if isinstance(data, (PhotospectralSquare, PhotospectralCube)):
+            # Fast path without intermediate SpectralObject
+            return cls.from_photometric_data(data.br, color_kernel(data.filter_system))
+        return cls((data @ get_xyz_cmf()).br, xyz_color_system)
+
+    @classmethod
+    def from_photometric_data(cls, br: np.ndarray, kernel: np.ndarray) -> Self:
+        """ Applies the `color_kernel()` (optionally with folded per-band factors) to the brightness array """
+        return cls(np.tensordot(kernel, br, axes=1), xyz_color_system)
 
     def to_color_system(self, new_color_system: ColorSystem) -> Self:
         """
@@ -2121,6 +2789,26 @@ class ColorLine(ColorObject):
         """ Returns spatial axis length """
         return self.br.shape[1]
 
+    @classmethod
+    def from_spectral_sequence(cls, data: Sequence[_TrueColorToolsObject]) -> Self:
+        """
+        Convolves a sequence of (photo)spectra with CIE 1931 XYZ color matching functions.
+        The photospectra are reconstructed in batches, and the convolution is a single matrix product.
+        """
+        xyz_cmf = get_xyz_cmf()
+        br = np.empty((3, len(data)))
+        spectra = reconstruct_batch(data, xyz_cmf.nm, crop=True, retain_photometry=False)
+        on_grid = [n for n, spectrum in enumerate(spectra) if np.array_equal(spectrum.nm, xyz_cmf.nm)]
+        if len(on_grid) != 0:
+            stacked = np.column_stack([spectra[n].br for n in on_grid])
+            # Rectangle integration of the product is the matrix multiplication
+            br[:, on_grid] = nm_step * (xyz_cmf.br.T @ stacked)
+        for n, spectrum in enumerate(spectra):
+            if n not in on_grid:
+                # Partially defined in the visible range (cropped)
+                br[:, n] = (spectrum @ xyz_cmf).br
+        return cls(br, xyz_color_system)
+
 
 class ColorImage(ColorObject):
     """
@@ -2169,3 +2857,25 @@ class ColorImage(ColorObject):
     def size(self):
         """ Returns the number of pixels """
         return self.width * self.height
+
+
+_lazy_constants = {
+    'stub_filter_system': get_stub_filter_system,
+    'sun_SI': get_sun_SI,
+    'sun_in_V': get_sun_in_V,
+    'sun_norm': get_sun_norm,
+    'sun_filter': get_sun_filter,
+    'vega_SI': get_vega_SI,
+    'vega_in_V': get_vega_in_V,
+    'vega_norm': get_vega_norm,
+    'xyz_cmf': get_xyz_cmf,
+}
+
+def __getattr__(name: str):
+    """ Provides the lazily initialized constants as module attributes """
+    if name in _lazy_constants:
+        return _lazy_constants[name]()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+# Public names for `from src.core import *`, which ignores `__getattr__` without the list
+__all__ = [name for name in globals() if not name.startswith('_')] + list(_lazy_constants)
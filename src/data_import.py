@@ -1,28 +1,49 @@
 """ Responsible for converting measurement data into a working form. """
 
-from astropy.io import fits
-from astropy.table import Table
-import astropy.units as u
+from functools import lru_cache
+from threading import Lock
+from warnings import filterwarnings
 import numpy as np
 
-# Disabling warnings about supplier non-compliance with FITS unit storage standards
-from warnings import filterwarnings
-filterwarnings(action='ignore', category=u.UnitsWarning, append=True)
+import src.auxiliary as aux
+
 
+_astropy_lock = Lock()
+
+def _astropy():
+    """
+    Imports astropy on the first call, since it is slow and only needed for FITS files.
+    Returns the `fits` module, the `Table` class, the `units` module and the internal flux density unit.
+    """
+    # The units are registered once, even if the files are read in parallel threads
+    with _astropy_lock:
+        return _astropy_setup()
 
-# Units of spectral flux density by wavelength and frequency
-flam = u.def_unit('FLAM', (u.erg / u.s) / (u.cm**2 * u.AA))
-fnu = u.def_unit('FNU', (u.erg / u.s) / (u.cm**2 * u.Hz))
-u.add_enabled_units((flam, fnu))
-u.add_enabled_aliases({'flam': flam})
-u.add_enabled_aliases({'ANGSTROMS': u.Angstrom})
-u.add_enabled_aliases({'angstroms': u.Angstrom})
-flux_density_SI = u.W / u.m**2 / u.nm
+@lru_cache(maxsize=1)
+def _astropy_setup():
+    from astropy.io import fits
+    from astropy.table import Table
+    import astropy.units as u
+    # Disabling warnings about supplier non-compliance with FITS unit storage standards
+    filterwarnings(action='ignore', category=u.UnitsWarning, append=True)
+    # Units of spectral flux density by wavelength and frequency
+    flam = u.def_unit('FLAM', (u.erg / u.s) / (u.cm**2 * u.AA))
+    fnu = u.def_unit('FNU', (u.erg / u.s) / (u.cm**2 * u.Hz))
+    u.add_enabled_units((flam, fnu))
+    u.add_enabled_aliases({'flam': flam})
+    u.add_enabled_aliases({'ANGSTROMS': u.Angstrom})
+    u.add_enabled_aliases({'angstroms': u.Angstrom})
+    flux_density_SI = u.W / u.m**2 / u.nm
+    return fits, Table, u, flux_density_SI
 
 
 supported_extensions = ('txt', 'dat', 'fits', 'fit')
 
-def file_reader(file: str) -> tuple[np.ndarray]:
+# FITS tables of at least these many points are binned while reading, in chunks of these many points
+binned_reading_min_size = 1_000_000
+binned_reading_chunk_size = 65536
+
+def file_reader(file: str, bin_step: int = None) -> tuple[np.ndarray]:
     """
     Gets the file path within the TCT main folder (text or FITS) and returns the spectrum points (nm, br, sd).
     The internal measurement standards are nanometers and energy spectral density ("energy counter").
@@ -30,13 +51,17 @@ def file_reader(file: str) -> tuple[np.ndarray]:
     You can also forcefully specify the data type through letters in the file extension (.txt for example):
     - .txtN for nanometers, .txtA for angstroms, .txtU for micrometers;
     - .txtE for energy counters per wavelength, .txtJ for energy counters per frequency, .txtP for photon counters.
+    With `bin_step`, large FITS tables may be returned already binned to the uniform grid with the step.
     """
     extension = file.split('.')[-1].lower()
     type_info = extension
     for ext in supported_extensions:
         type_info = type_info.removeprefix(ext)
     if extension.startswith('fit'):
-        nm, br, sd = fits_reader(file, type_info)
+        if bin_step is None or (binned := fits_binned_reader(file, type_info, bin_step)) is None:
+            nm, br, sd = fits_reader(file, type_info)
+        else:
+            nm, br, sd = binned
     else:
         nm, br, sd = txt_reader(file, type_info)
     return nm, br, sd
@@ -64,6 +89,7 @@ def txt_reader(file: str, type_info: str) -> tuple[np.ndarray]:
 
 def fits_reader(file: str, type_info: str) -> tuple[np.ndarray]:
     """ Imports spectral data from a FITS file in standards of CALSPEC, VizeR, UVES, BAAVSS, etc """
+    fits, Table, u, flux_density_SI = _astropy()
     if 'n' in type_info:
         wl_unit = u.nm
     elif 'a' in type_info:
@@ -125,6 +151,59 @@ def fits_reader(file: str, type_info: str) -> tuple[np.ndarray]:
         sd = np.array(sd)
     return nm, br, sd
 
+def fits_binned_reader(file: str, type_info: str, step: int) -> tuple[np.ndarray] | None:
+    """
+    Imports a large FITS table spectrum in chunks and bins it to the uniform grid with the step,
+    see `aux.spectral_binning_chunks()`. Only the binned spectrum is held in memory.
+    Returns None if the spectrum is small or is not a dense sorted table, so it should be imported with `fits_reader()`.
+    """
+    fits, Table, u, flux_density_SI = _astropy()
+    with fits.open(file, memmap=True) as hdul:
+        if len(hdul) < 2 or len(columns := hdul[1].columns) < 2:
+            return None
+        data = hdul[1].data
+        wl_id = search_column(columns.names, 'wl')
+        br_id = search_column(columns.names, 'br')
+        sd_id = search_column(columns.names, 'sd') if len(columns) > 2 else None
+        # The columns are memory-mapped, or arrays of the single row as in `fits_reader()`
+        wl = data.field(wl_id)
+        br = data.field(br_id)
+        sd = None if sd_id is None else data.field(sd_id)
+        if wl.ndim > 1:
+            wl = wl[0]
+        if br.ndim == 2:
+            br = br[0]
+        if sd is not None and sd.ndim > 1:
+            sd = sd[0]
+        if wl.size < binned_reading_min_size or br.shape != wl.shape or (sd is not None and sd.shape != wl.shape):
+            return None
+        try:
+            # Standardization of units of measurement as scale factors
+            if 'n' in type_info:
+                wl_unit = u.nm
+            elif 'a' in type_info:
+                wl_unit = u.Angstrom
+            elif 'u' in type_info:
+                wl_unit = u.micron
+            else:
+                wl_unit = u.Unit(columns[wl_id].unit)
+            to_nm = wl_unit.to(u.nm)
+            br_factor = u.Unit(columns[br_id].unit).to(flux_density_SI)
+            sd_factor = None if sd is None else u.Unit(columns[sd_id].unit).to(flux_density_SI)
+            nm1 = aux.grid(wl[0] * to_nm, wl[-1] * to_nm, step)
+            chunks = (
+                (
+                    wl[i:i+binned_reading_chunk_size] * to_nm,
+                    br[i:i+binned_reading_chunk_size] * br_factor,
+                    None if sd is None else sd[i:i+binned_reading_chunk_size] * sd_factor
+                ) for i in range(0, wl.size, binned_reading_chunk_size)
+            )
+            br1, sd1 = aux.spectral_binning_chunks(chunks, nm1, step)
+        except (ValueError, u.UnitsError):
+            # Not a dense sorted spectrum or the units are not convertible by scaling
+            return None
+    return nm1, br1, sd1
+
 def search_column(names: list[str], target: str):
     """ Returns the index of the FITS column of interest """
     names = [name.lower() for name in names]
@@ -3,45 +3,246 @@ Support of the database of JSON5 files and filters profiles.
 Describes the object name data storage class.
 """
 
-from collections.abc import Sequence
-from json5 import load as json5load
+from collections.abc import Sequence, Iterable
+from os import cpu_count
+from functools import lru_cache
+from inspect import getsource
+from hashlib import sha1
+from json5 import loads as json5loads
 from pathlib import Path
 from traceback import format_exc
+import pickle
 
-from src.core import ObjectName
+from src.core import ObjectName, filter_registry, file_spectrum, spectrum_cache_file
+import src.auxiliary as aux
+
+
+# Compiled database snapshot
+
+# Parsing of JSON5 files and object names is slow, so the results are stored in a binary snapshot.
+# Each source file record is invalidated by its modification time, size and content hash.
+# The whole snapshot is invalidated by the version and the source code of the parsing and pickled classes.
+snapshot_version = 2
+snapshot_file = Path('.cache/database.pickle')
+
+@lru_cache(maxsize=None)
+def snapshot_key() -> str:
+    """ Returns the snapshot version combined with the hash of the code that produces the file records """
+    try:
+        sources = ''.join(getsource(code) for code in (ObjectName, import_file))
+    except (OSError, TypeError):
+        return str(snapshot_version) # the source is not available, the version has to be bumped manually
+    return f'{snapshot_version} {sha1(sources.encode()).hexdigest()}'
+
+def load_snapshot() -> dict[str, dict]:
+    """ Returns the file records of the database snapshot, or an empty dictionary if it is missing or outdated """
+    try:
+        with open(snapshot_file, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot['version'] == snapshot_key():
+            return snapshot['files']
+    except FileNotFoundError:
+        pass
+    except Exception:
+        print(f'Database snapshot "{snapshot_file}" could not be read and will be rebuilt.')
+        print(f'More precisely, {format_exc(limit=0)}')
+    return {}
+
+def save_snapshot(records: dict[str, dict]):
+    """ Writes the file records to the database snapshot """
+    try:
+        snapshot_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = snapshot_file.with_suffix('.tmp')
+        with open(temp_file, 'wb') as f:
+            pickle.dump({'version': snapshot_key(), 'files': records}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        temp_file.replace(snapshot_file) # to not leave a broken snapshot in case of interruption
+    except OSError:
+        print(f'Database snapshot "{snapshot_file}" could not be saved.')
+        print(f'More precisely, {format_exc(limit=0)}')
 
 
 # Importing files
 
 def import_DBs(folders: Sequence[str]):
     """ Returns databases of objects and references were found in the given folders """
+    return merge_records(import_records(folders))
+
+def import_records(folders: Sequence[str], records: dict[str, dict] = None) -> dict[str, dict]:
+    """
+    Returns the records of the JSON5 files were found in the given folders.
+    Unchanged files are taken from the given records, otherwise from the snapshot.
+    """
+    snapshot = load_snapshot() if records is None else records
+    actual_records = {}
+    for folder in folders:
+        import_folder(folder, snapshot, actual_records)
+    if actual_records.keys() != snapshot.keys() or any(record is not snapshot[file] for file, record in actual_records.items()):
+        save_snapshot(actual_records)
+    return actual_records
+
+def merge_records(records: dict[str, dict]):
+    """ Returns databases of objects and references owned by the file records (the last file wins) """
     objectsDB = {}
     refsDB = {}
-    for folder in folders:
-        additional_data = import_folder(folder)
-        objectsDB |= additional_data[0]
-        refsDB |= additional_data[1]
+    for record in records.values():
+        objectsDB |= record['objects']
+        refsDB |= record['refs']
     return objectsDB, refsDB
 
-def import_folder(folder: str):
-    """ Returns objects and references were found in the given folder """
+def reload_DBs(folders: Sequence[str], records: dict[str, dict], objectsDB: dict[ObjectName, dict], refsDB: dict[str, list]):
+    """
+    Re-imports only the changed files and patches the objects and references databases in place.
+    Returns the new file records and lists of the added, removed and modified object names.
+    """
+    new_records = import_records(folders, records)
+    changed_files = [
+        file for file in records.keys() | new_records.keys()
+        if file not in records or file not in new_records or records[file]['objects'] is not new_records[file]['objects']
+    ]
+    changes = {'added': [], 'removed': [], 'modified': []}
+    affected_objects = set()
+    affected_refs = set()
+    for file in changed_files:
+        for record in (records.get(file), new_records.get(file)):
+            if record is not None:
+                affected_objects |= record['objects'].keys()
+                affected_refs |= record['refs'].keys()
+    for database, affected, category in ((objectsDB, affected_objects, 'objects'), (refsDB, affected_refs, 'refs')):
+        for key in affected:
+            value = None
+            for record in new_records.values():
+                value = record[category].get(key, value)
+            if value is None:
+                del database[key]
+                change = 'removed'
+            elif key not in database:
+                database[key] = value
+                change = 'added'
+            elif database[key] != value:
+                database[key] = value
+                change = 'modified'
+            else:
+                continue
+            if category == 'objects':
+                changes[change].append(key)
+    if changed_files:
+        # The added keys are moved to their positions in the files order, as in a fresh import
+        merged_objects, merged_refs = merge_records(new_records)
+        for database, merged in ((objectsDB, merged_objects), (refsDB, merged_refs)):
+            reorder_keys(database, merged.keys())
+    if any(changes.values()):
+        print('Database reloaded: {} objects added, {} removed, {} modified'.format(*map(len, changes.values())))
+    return new_records, changes
+
+def reorder_keys(database: dict, keys: Iterable):
+    """
+    Moves the keys of the dictionary to the given order in place, the missing keys are skipped.
+    The keys before the first misplaced one are not touched, so an appended key costs no re-insertions.
+    """
+    keys = list(keys)
+    start = next((i for i, (key1, key2) in enumerate(zip(database, keys)) if key1 != key2), None)
+    if start is not None:
+        tail = {key: database.pop(key) for key in keys[start:] if key in database}
+        database |= tail
+
+def import_folder(folder: str, records: dict[str, dict] = None, actual_records: dict[str, dict] = None):
+    """
+    Returns objects and references were found in the given folder.
+    Unchanged files are taken from the records, if given.
+    Records of the successfully imported files are added to `actual_records`.
+    """
+    if records is None:
+        records = {}
+    if actual_records is None:
+        actual_records = {}
     objects = {}
     refs = {}
     files = sorted(Path(folder).glob('**/*.json5'))
     for file in files:
-        with open(file, 'rt', encoding='UTF-8') as f:
-            try:
-                content = json5load(f)
-                for key, value in content.items():
-                    if type(value) == list:
-                        refs |= {key: value}
-                    else:
-                        objects |= {ObjectName(key): value}
-            except ValueError:
-                print(f'Error in JSON5 syntax of file "{file.name}", its upload was cancelled.')
-                print(f'More precisely, {format_exc(limit=0)}')
+        record = import_file(file, records.get(str(file)))
+        if record is not None:
+            actual_records[str(file)] = record
+            objects |= record['objects']
+            refs |= record['refs']
     return objects, refs
 
+def import_file(file: Path, record: dict = None) -> dict | None:
+    """
+    Returns the file record with objects and references, reusing the given record if the file has not changed.
+    Returns `None` in case of a syntax error.
+    """
+    stat = file.stat()
+    if record is not None and record['mtime'] == stat.st_mtime_ns and record['size'] == stat.st_size:
+        return record
+    data = file.read_bytes()
+    digest = sha1(data).hexdigest()
+    if record is not None and record['hash'] == digest:
+        # Only the modification time has changed
+        return record | {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+    objects = {}
+    refs = {}
+    try:
+        content = json5loads(data.decode('UTF-8'))
+        for key, value in content.items():
+            if type(value) == list:
+                refs |= {key: value}
+            else:
+                objects |= {ObjectName(key): value}
+    except ValueError:
+        print(f'Error in JSON5 syntax of file "{file.name}", its upload was cancelled.')
+        print(f'More precisely, {format_exc(limit=0)}')
+        return None
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'hash': digest, 'objects': objects, 'refs': refs}
+
+
+# Prefetching of the external spectrum files
+
+# Parsing is CPU-bound, so the files without sidecar cache files are parsed in processes,
+# which are started only for sufficiently many files
+min_files_per_worker = 16
+
+def file_references(objectsDB: dict[ObjectName, dict]) -> set[tuple[str, bool]]:
+    """ Returns the set of spectrum files referenced by the database objects, with their emission spectrum flags """
+    return {
+        (content['file'], bool(content.get('is_emission_spectrum', False)))
+        for content in objectsDB.values() if 'file' in content
+    }
+
+def _prefetch_file(reference: tuple[str, bool]):
+    """ Reads the spectrum file into the spectra caches, reading errors are reported by `database_parser()` later """
+    try:
+        file_spectrum(*reference)
+    except Exception:
+        pass
+
+def prefetch_file_spectra(objectsDB: dict[ObjectName, dict], workers: int = None, tag: str = 'ALL') -> int:
+    """
+    Reads the spectrum files referenced by the database objects with the tag into the spectra caches in advance,
+    so that the color calculation does not wait for the files one by one. The files not yet in the sidecar cache
+    are parsed by worker processes, then all the spectra are loaded into the memory cache of this process.
+    Returns the number of the files.
+    """
+    if tag != 'ALL':
+        objectsDB = {obj_name: objectsDB[obj_name] for obj_name in obj_names_list(objectsDB, tag)}
+    references = sorted(file_references(objectsDB))
+    missing = []
+    for file, is_emission in references:
+        try:
+            if not spectrum_cache_file(file, is_emission, False).exists():
+                missing.append((file, is_emission))
+        except OSError:
+            pass # the missing file is reported later
+    if workers is None:
+        workers = cpu_count() or 1
+    workers = min(workers, len(missing) // min_files_per_worker)
+    if workers > 1:
+        with aux.process_pool(workers) as executor:
+            for _ in executor.map(_prefetch_file, missing, chunksize=min_files_per_worker):
+                pass
+    for reference in references:
+        _prefetch_file(reference)
+    return len(references)
+
 
 # Imported database iterators
 
@@ -105,6 +306,18 @@ def tag_list(database: dict[ObjectName, dict]) -> list[str]:
                         tag_set.add('/'.join(supertags))
     return sorted(tag_set)
 
+def update_names_dict(
+        names: dict[str, ObjectName], changes: dict[str, list[ObjectName]], lang: str, database: dict[ObjectName, dict]
+    ):
+    """ Patches the front-end names dictionary (of the "ALL" tag) after the database reload """
+    for obj_name in changes['removed']:
+        names.pop(obj_name(lang), None)
+    if changes['added']:
+        # The added names are placed in the database order
+        for obj_name in changes['added']:
+            names[obj_name(lang)] = obj_name
+        reorder_keys(names, dict.fromkeys(obj_name(lang) for obj_name in database))
+
 def notes_list(obj_names: list[ObjectName], lang: str) -> list[str]:
     """ Generates a list of notes found in the spectra database """
     notes = []
@@ -120,5 +333,4 @@ def notes_list(obj_names: list[ObjectName], lang: str) -> list[str]:
 
 def list_filters() -> tuple[str, ...]:
     """ Returns list of file names were found in the filters folder """
-    files = sorted(Path('filters').glob('*.*'))
-    return tuple(file.stem for file in files)
+    return tuple(filter_registry.files)
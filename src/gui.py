@@ -9,7 +9,7 @@ import numpy as np
 
 import src.strings as tr
 from src.core import ColorSystem
-from src.image_processing import supported_formats
+from src.image_processing import supported_formats, chunk_workers
 
 
 # TCT style colors
@@ -232,10 +232,19 @@ def generate_layout(
     ]
     tab2_col2_2 = [
         [sg.Checkbox(tr.gui_upscale[lang], default=False, key='tab2_upscale', tooltip=tr.gui_upscale_tooltip[lang])],
+        [sg.Checkbox(tr.gui_dedup[lang], default=False, key='tab2_dedup', tooltip=tr.gui_dedup_tooltip[lang])],
+        [
+            sg.Checkbox(tr.gui_background[lang], default=False, key='tab2_background', tooltip=tr.gui_background_tooltip[lang]),
+            sg.Input('0', size=1, enable_events=True, key='tab2_background_threshold', expand_x=True),
+        ],
         [
             sg.Text(tr.gui_chunks[lang], key='tab2_chunks_text', tooltip=tr.gui_chunks_tooltip[lang]),
             sg.Input('1', size=1, key='tab2_chunks', expand_x=True),
         ],
+        [
+            sg.Text(tr.gui_chunk_workers[lang], key='tab2_workers_text', tooltip=tr.gui_chunk_workers_tooltip[lang]),
+            sg.Input(str(chunk_workers), size=1, key='tab2_workers', expand_x=True),
+        ],
     ]
     tab2_col2 = [
         #[sg.Push(), sg.Text(tr.gui_output[lang], font=title_font, key='tab2_title2'), sg.Push()],
@@ -400,7 +409,10 @@ def translate_win0(window: sg.Window, tab1_loaded: bool, tab1_albedo_note: dict[
     #window['tab2_autoalign'].update(text=tr.gui_autoalign[lang])
     #window['tab2_plotpixels'].update(text=tr.gui_plotpixels[lang])
     window['tab2_upscale'].update(text=tr.gui_upscale[lang])
+    window['tab2_dedup'].update(text=tr.gui_dedup[lang])
+    window['tab2_background'].update(text=tr.gui_background[lang])
     window['tab2_chunks_text'].update(tr.gui_chunks[lang])
+    window['tab2_workers_text'].update(tr.gui_chunk_workers[lang])
     window['tab2_preview_button'].update(tr.gui_preview[lang])
     window['tab2_process_button'].update(tr.gui_process[lang])
     window['tab2_format_text'].update(tr.gui_format[lang])
@@ -1,15 +1,23 @@
 """ Responsible for converting image data into a working form. """
 
+import ast
 from collections.abc import Sequence
 from pathlib import Path
-from functools import lru_cache
 import numpy as np
-from astropy.io import fits
 from PIL import Image
 
-@lru_cache(maxsize=1)
+from src.cache import cached
+
+
+# Byte budgets of the caches of the opened images and the imported arrays, reused by the previews and reloading.
+# Only the last imported band is kept, as the bands are read one after another.
+image_files_cache_budget = 256 * 2**20
+bw_images_cache_budget = 512 * 2**20
+bw_images_cache_entries = 1
+
 def cube_reader(file: str) -> tuple[np.ndarray, np.ndarray]:
     """ Imports spectral data from the spectral cube in FITS format """
+    from astropy.io import fits # lazy import for the faster startup
     with fits.open(file) as hdul:
         #hdul.info()
         #print(repr(hdul[0].header))
@@ -17,11 +25,24 @@ def cube_reader(file: str) -> tuple[np.ndarray, np.ndarray]:
         nm = np.array(hdul['wavelength'].data)
     return nm, br
 
-@lru_cache(maxsize=8)
+def cube_memmap_reader(file: str) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Opens the spectral cube in FITS format without loading the data into memory.
+    Returns the wavelengths and the memory-mapped (scaled FITS data is loaded) brightness array of shape (nm, x, y).
+    """
+    from astropy.io import fits # lazy import for the faster startup
+    with fits.open(file, memmap=True) as hdul:
+        # The memory map stays open while the data is referenced
+        br = hdul['sci'].data.transpose((0, 2, 1))
+        nm = np.array(hdul['wavelength'].data)
+    return nm, br
+
+@cached('image_files', image_files_cache_budget)
 def cached_open(file: str):
     """ Increases the speed of image reloading """
     if file.split('.')[-1].lower() in ('fts', 'fit', 'fits'):
         # FITS is tested only with OPAL formatting
+        from astropy.io import fits # lazy import for the faster startup
         with fits.open(file) as hdul:
             #hdul.info()
             #print(repr(hdul[0].header))
@@ -41,7 +62,32 @@ def rgb_reader(file: str, formulas: list = None) -> np.ndarray:
         br[2] = eval(formulas[2], {'x': br[2]})
     return br
 
-@lru_cache(maxsize=1)
+def rgb_palette_reader(file: str, formulas: list = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Imports a RGB image as the palette of its unique colors, array of shape (3, colors) as in `rgb_reader()`,
+    and the array of palette indices of the pixels. The formulas are evaluated for the palette only.
+    """
+    img = cached_open(file)
+    if to_supported_mode(img.mode) != 'RGB':
+        # Not a 8-bit image: each pixel is its own palette entry
+        br = rgb_reader(file, formulas)
+        return br.reshape(3, -1), np.arange(br[0].size).reshape(br.shape[1:])
+    img = img.convert('RGB')
+    arr = img2array(img).transpose((1, 0, 2))
+    # 24-bit keys of the pixel colors and the table of their presence
+    keys = (arr[..., 0].astype('uint32') << 16) | (arr[..., 1].astype('uint32') << 8) | arr[..., 2]
+    is_present = np.zeros(2**24, dtype='bool')
+    is_present[keys] = True
+    palette_keys = np.flatnonzero(is_present)
+    index_table = np.cumsum(is_present, dtype='uint32') - 1
+    br = np.stack((palette_keys & 255, (palette_keys >> 8) & 255, palette_keys >> 16)) / 255 # reversed as in `rgb_reader()`
+    if formulas is not None:
+        br[0] = eval(formulas[0], {'x': br[0]})
+        br[1] = eval(formulas[1], {'x': br[1]})
+        br[2] = eval(formulas[2], {'x': br[2]})
+    return br, index_table[keys]
+
+@cached('bw_images', bw_images_cache_budget, bw_images_cache_entries)
 def bw_reader(file: str) -> np.ndarray:
     """ Imports spectral data from a black and white image """
     img = cached_open(file)
@@ -54,6 +100,50 @@ def bw_reader(file: str) -> np.ndarray:
         br = br[np.argmax(br.sum(axis=(1,2)))]
     return br
 
+def bw_raw_reader(file: str) -> tuple[np.ndarray, int] | None:
+    """
+    Imports a black and white image as an array of non-negative integer values and its color depth,
+    see `bw_reader()`. Returns None for floating-point images and values out of the 16-bit range.
+    """
+    img = cached_open(file)
+    mode = to_supported_mode(img.mode)
+    if mode == 'F':
+        return None
+    raw = img2array(img.convert(mode)).transpose()
+    if raw.ndim == 3:
+        print(f'# Note for the image "{Path(file).name}"')
+        print('- This is a multi-channel image, but should be single-channel. The brightest channel is extracted.')
+        raw = raw[np.argmax(raw.sum(axis=(1,2), dtype='int64'))]
+    if raw.min() < 0 or raw.max() > 65535:
+        return None
+    return raw, color_depth(mode)
+
+# Syntax allowed in the formulas that are evaluated per value: arithmetic on `x`, numbers and `abs()`
+_elementwise_nodes = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Constant, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub
+)
+
+def is_elementwise(formula: str) -> bool:
+    """
+    Checks that the formula only uses the arithmetic, so each value is transformed independently.
+    Formulas using the whole array, like `x/x.max()`, are not element-wise.
+    """
+    try:
+        tree = ast.parse(formula, mode='eval')
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if not (isinstance(node.func, ast.Name) and node.func.id == 'abs' and len(node.args) == 1 and not node.keywords):
+                return False
+        elif isinstance(node, ast.Name):
+            if node.id not in ('x', 'abs'):
+                return False
+        elif not isinstance(node, _elementwise_nodes):
+            return False
+    return True
+
 def bw_list_reader(files: Sequence[str], formulas: list[str] = None) -> np.ndarray:
     """ Imports and combines the list of black and white images into one array """
     if formulas is None:
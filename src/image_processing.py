@@ -4,22 +4,127 @@ from collections.abc import Callable
 from traceback import format_exc
 from time import monotonic
 from math import sqrt, ceil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import reduce
 import numpy as np
 from PIL import Image
 from tifffile import imwrite
 
-from src.core import FilterSystem, SpectralCube, PhotospectralCube, ColorLine, ColorImage, sun_norm, xyz_color_system
+from src.core import FilterSystem, SpectralCube, LazySpectralCube, Photospectrum, PhotospectralCube, ColorLine, ColorImage, \
+    get_sun_norm, get_xyz_cmf, xyz_color_system, color_kernel
+import src.auxiliary as aux
 import src.image_import as ii
 
 
+# Default number of threads for the chunked color calculation of large images.
+# Each thread holds a chunk and its intermediate arrays in memory, so it's kept small.
+chunk_workers = 2
+
+# Memory-mapped spectral cubes are processed in tiles of rows, each tile by its own thread.
+# Only these many tiles are loaded at once, and a tile is limited to these many bytes of the file data.
+tiles_in_flight = 4
+tile_size_limit = 16 * 2**20
+
+def render_tiles(
+        cube: LazySpectralCube, convert: Callable, tile_pixels: int, threshold: float = None, log: Callable = print
+    ) -> np.ndarray:
+    """
+    Returns the XYZ image of shape (3, width, height) for the memory-mapped spectral cube.
+    Each tile is read, resampled, converted with `convert()` and convolved independently.
+    With the `threshold`, only the pixels with a value above it are processed, the background is left black.
+    If the spectra need extrapolation, its modes are decided for the whole cube in an extra pass over the tiles,
+    so that the result does not depend on the tiling. The pass reads and converts the memory-mapped file once more:
+    the tiles are not kept, since the cube may not fit in memory.
+    """
+    rows_per_tile = max(1, min(tile_pixels, tile_size_limit // (8 * cube.nm.size)) // cube.width)
+    tiles = [slice(start, start+rows_per_tile) for start in range(0, cube.height, rows_per_tile)]
+    xyz = np.zeros((3, cube.width, cube.height))
+    nm_cmf = get_xyz_cmf().nm
+    def load_tile(rows: slice):
+        """ Returns the converted spectral square of the tile foreground, the tile shape and the foreground mask """
+        br = cube.read_rows(rows)
+        tile_shape = br.shape[1:]
+        br = br.reshape(cube.nm.size, -1)
+        foreground = slice(None) if threshold is None else br.max(axis=0) > threshold
+        square = None if (br := br[:, foreground]).size == 0 else convert(cube.to_square(br))
+        return square, tile_shape, foreground
+    def tile_statistics(rows: slice):
+        square = load_tile(rows)[0]
+        if square is None:
+            return np.tile(aux.no_extrapolation_statistics, (2, 1))
+        return aux.extrapolation_statistics(square.nm, square.br, nm_cmf)
+    def process_tile(rows: slice):
+        square, tile_shape, foreground = load_tile(rows)
+        colors = np.zeros((3, np.prod(tile_shape, dtype='int')))
+        if square is not None:
+            square = square.define_on_range(nm_cmf, crop=True, statistics=statistics)
+            colors[:, foreground] = ColorLine.from_spectral_data(square).br
+        # The tiles write to non-overlapping parts of the array
+        xyz[:, :, rows] = colors.reshape(3, *tile_shape)
+    # Idle threads do not hold the data, so the thread number bounds the memory usage
+    with ThreadPoolExecutor(max_workers=tiles_in_flight) as executor:
+        statistics = None
+        nm = cube.to_square(np.ones((cube.nm.size, 1))).nm # the uniform grid of the tiles
+        if nm[0] > nm_cmf[0] or nm[-1] < nm_cmf[-1]:
+            log('Deciding the extrapolation of the spectral cube')
+            statistics = reduce(aux.merge_extrapolation_statistics, executor.map(tile_statistics, tiles))
+        futures = [executor.submit(process_tile, rows) for rows in tiles]
+        for j, future in enumerate(as_completed(futures), start=1):
+            future.result() # raises the tile exception, if any
+            log(f'Color calculated for {j} tiles out of {len(tiles)}')
+    return xyz
+
+def lookup_colors(
+        bands: list[tuple[np.ndarray, int]], formulas: list[str], kernel: np.ndarray, threshold: float = None
+    ) -> np.ndarray:
+    """
+    Returns the XYZ image of shape (3, width, height) for the integer band images with their color depths.
+    The colors are linear in the band values, so the formula and the color kernel column of each band
+    are evaluated once per possible integer value, and the image is rendered by gathering and summing.
+    The formulas must be element-wise (see `image_import.is_elementwise()`), the others give wrong results.
+    With the `threshold`, only the pixels with a band value above it are summed, the background is left black.
+    """
+    # Pixel-major accumulation in the memory order of the imported images, transposed back at the end
+    xyz = np.zeros((*bands[0][0].shape[::-1], 3))
+    tables = []
+    foreground = None
+    for (raw, depth), formula, kernel_column in zip(bands, formulas, kernel.T):
+        levels = np.arange(int(raw.max()) + 1) / depth
+        values = np.broadcast_to(eval(formula, {'x': levels}), levels.shape)
+        tables.append(values[:, np.newaxis] * kernel_column) # shape (levels, 3)
+        if threshold is not None:
+            is_foreground = np.take(values > threshold, raw.T)
+            foreground = is_foreground if foreground is None else foreground | is_foreground
+    if foreground is None:
+        for (raw, _), table in zip(bands, tables):
+            xyz += np.take(table, raw.T, axis=0)
+    else:
+        colors = np.zeros((np.count_nonzero(foreground), 3))
+        for (raw, _), table in zip(bands, tables):
+            colors += np.take(table, raw.T[foreground], axis=0)
+        xyz[foreground] = colors
+    return xyz.transpose(2, 1, 0)
+
 def image_parser(
         image_mode: int, preview_flag: bool, px_lower_limit: int, px_upper_limit: int,
         single_file: str, files: list, filters: list, formulas: list,
-        sun_divide: bool, sun_multiply: bool, photons: bool, upscale: bool, log: Callable
+        sun_divide: bool, sun_multiply: bool, photons: bool, upscale: bool, log: Callable, dedup: bool = False,
+        background: float = None, workers: int = None, elementwise: bool = False
     ):
-    """ Receives user input and performs processing in a parallel thread """
+    """
+    Receives user input and performs processing in a parallel thread.
+    With `dedup`, the colors of RGB images are calculated only for the palette of unique pixel values.
+    With the `background` threshold, the pixels with all imported values not exceeding it are not processed
+    and are filled with black.
+    The chunks of large images are processed by `workers` threads, `chunk_workers` by default.
+    Integer multiband images are converted with lookup tables if the formulas are arithmetic on `x`,
+    or for any formulas with `elementwise`, which tells they transform each value independently.
+    """
     log('Starting the image processing thread')
     start_time = monotonic()
+    palette_index = None
+    bands = None
+    foreground = None
     try:
         match image_mode:
             case 0: # Multiband image
@@ -29,45 +134,109 @@ def image_parser(
                 filters = np.array(filters)[not_empty_files]
                 formulas = np.array(formulas)[not_empty_files]
                 filter_system = FilterSystem.from_list(filters)
-                log('Importing the images')
-                cube = PhotospectralCube(filter_system, ii.bw_list_reader(files, formulas))
+                if elementwise or all(ii.is_elementwise(formula) for formula in formulas):
+                    bands = [ii.bw_raw_reader(file) for file in files]
+                    if any(band is None for band in bands):
+                        bands = None
+                    elif preview_flag:
+                        # The same way as the cube downscaling
+                        bands = [(aux.spatial_downscaling(raw[np.newaxis], px_lower_limit)[0], depth) for raw, depth in bands]
+                if bands is None:
+                    log('Importing the images')
+                    cube = PhotospectralCube(filter_system, ii.bw_list_reader(files, formulas))
+                else:
+                    # The integer images are converted to colors with lookup tables, without the cube
+                    log('Importing the images as integer arrays')
+                    cube = None
             case 1: # RGB image
                 filter_system = FilterSystem.from_list(filters)
-                log('Importing the RGB image')
-                cube = PhotospectralCube(filter_system, ii.rgb_reader(single_file, formulas))
+                if dedup and not preview_flag:
+                    log('Importing the RGB image palette')
+                    palette, palette_index = ii.rgb_palette_reader(single_file, formulas)
+                    log(f'Found {palette.shape[1]} unique colors in {palette_index.size} pixels')
+                    # The palette is processed as a single-column image
+                    cube = PhotospectralCube(filter_system, palette[:, :, np.newaxis])
+                else:
+                    log('Importing the RGB image')
+                    cube = PhotospectralCube(filter_system, ii.rgb_reader(single_file, formulas))
             case 2: # Spectral cube
-                log('Importing the spectral cube')
-                cube = SpectralCube.from_file(single_file)
-        if preview_flag:
+                # The cube is read from the file on demand
+                log('Opening the spectral cube')
+                cube = LazySpectralCube.from_file(single_file)
+        if preview_flag and cube is not None:
             log('Downscaling')
             cube = cube.downscale(px_lower_limit)
+        if background is not None and cube is not None and not isinstance(cube, LazySpectralCube):
+            # For the palette, the background colors are skipped and scattered as black
+            log('Detecting the background')
+            foreground = ~cube.background_mask(background)
         if photons:
             log('Converting photon spectral density to energy density')
-            cube = cube.convert_from_photon_spectral_density()
         if sun_divide:
             log('Dividing by Solar spectrum to remove the reflected color of the Sun')
-            cube /= sun_norm
         if sun_multiply:
             log('Multiplying by Solar spectrum to simulate the reflection of sunlight')
-            cube *= sun_norm
-        px_num = cube.size
-        if preview_flag or px_num < px_upper_limit:
-            log('Color calculating')
-            img = ColorImage.from_spectral_data(cube)
+        def convert(target):
+            """ Applies the selected conversions to the (photo)spectral data """
+            if photons:
+                target = target.convert_from_photon_spectral_density()
+            if sun_divide:
+                target /= get_sun_norm()
+            if sun_multiply:
+                target *= get_sun_norm()
+            return target
+        if isinstance(cube, PhotospectralCube) or bands is not None:
+            # The reconstruction and the convolution are linear for photospectral cubes,
+            # so the per-band operations are applied to the color kernel instead of the cube
+            filter_system = cube.filter_system if bands is None else filter_system
+            kernel = color_kernel(filter_system) * convert(Photospectrum(filter_system, np.ones(len(filter_system)))).br
+            to_color = lambda data: ColorLine.from_photometric_data(data.br, kernel)
+        elif isinstance(cube, SpectralCube):
+            cube = convert(cube)
+            to_color = ColorLine.from_spectral_data
+        if bands is not None:
+            log('Color calculating with per-band lookup tables')
+            img = ColorImage(lookup_colors(bands, formulas, kernel, background), xyz_color_system)
+            px_num = bands[0][0].size
+        elif isinstance(cube, LazySpectralCube):
+            log('Color calculating in tiles')
+            img = ColorImage(render_tiles(cube, convert, px_upper_limit, background, log), xyz_color_system)
+            px_num = cube.size
         else:
-            square = cube.flatten()
-            chunk_num = ceil(px_num / px_upper_limit)
-            img_array = np.empty((3, px_num))
-            for i in range(chunk_num):
-                j = i+1
-                try:
-                    chunk = square[i*px_upper_limit:j*px_upper_limit]
-                except IndexError:
-                    chunk = square[i*px_upper_limit:]
-                img_chunk = ColorLine.from_spectral_data(chunk)
-                img_array[:,i*px_upper_limit:j*px_upper_limit] = img_chunk.br
-                log(f'Color calculated for {j} chunks out of {chunk_num}')
-            img = ColorImage(img_array.reshape(3, cube.width, cube.height), xyz_color_system)
+            width, height = cube.width, cube.height
+            px_num = cube.size
+            if foreground is not None:
+                # Only the foreground pixels are processed, as a square
+                cube = cube.flatten(foreground)
+                log(f'Found {cube.size} foreground pixels out of {px_num}')
+            if preview_flag or cube.size < px_upper_limit:
+                log('Color calculating')
+                colors = to_color(cube).br
+            else:
+                square = cube if foreground is not None else cube.flatten()
+                chunk_num = ceil(square.size / px_upper_limit)
+                colors = np.empty((3, square.size))
+                def process_chunk(i: int):
+                    # The chunks write to non-overlapping parts of the array
+                    chunk_slice = slice(i*px_upper_limit, (i+1)*px_upper_limit)
+                    colors[:, chunk_slice] = to_color(square[chunk_slice]).br
+                # NumPy releases the GIL in the matrix operations, so the chunks are processed in parallel threads
+                with ThreadPoolExecutor(max_workers=max(1, workers or chunk_workers)) as executor:
+                    futures = [executor.submit(process_chunk, i) for i in range(chunk_num)]
+                    for j, future in enumerate(as_completed(futures), start=1):
+                        future.result() # raises the chunk exception, if any
+                        log(f'Color calculated for {j} chunks out of {chunk_num}')
+            if foreground is None:
+                img = ColorImage(colors.reshape(3, width, height), xyz_color_system)
+            else:
+                log('Filling the background')
+                img_array = np.zeros((3, width, height))
+                img_array[:, foreground] = colors
+                img = ColorImage(img_array, xyz_color_system)
+        if palette_index is not None:
+            log('Scattering the palette colors to the pixels')
+            img = ColorImage(img.br[:, :, 0][:, palette_index], xyz_color_system)
+            px_num = palette_index.size
         if upscale and px_num < px_lower_limit and (times := round(sqrt(px_lower_limit / px_num))) != 1:
             log('Upscaling')
             img = img.upscale(times)
@@ -4,16 +4,19 @@ import FreeSimpleGUI as sg
 from sigfig import round as sigfig_round
 from copy import deepcopy
 from time import strftime
+from threading import Thread
 import numpy as np
 
-from src.core import Spectrum, ReflectingBody, ColorSystem, ColorPoint, FilterNotFoundError, \
-    visible_range, get_filter, database_parser, sun_norm
+from src.core import ObjectName, Spectrum, ReflectingBody, ColorSystem, ColorPoint, ColorLine, FilterNotFoundError, \
+    visible_range, get_filter, database_parser, get_sun_norm, xyz_color_system, blackbody_redshift_photometry
 import src.gui as gui
 import src.auxiliary as aux
 import src.database as db
 import src.image_processing as ip
 from src.table_generator import generate_table
-import src.plotter as pl
+
+# MatPlotLib is imported on the first plotting, since it takes a noticeable time of the startup
+pl = aux.lazy_import('src.plotter')
 import src.strings as tr
 
 
@@ -22,6 +25,7 @@ def launch_window(lang: str):
     # Databases declaration
     database_folders = ('spectra', 'spectra_extras')
     objectsDB, refsDB = {}, {}
+    db_records = {}
     namesDB = {}
     tagsDB = []
     filtersDB: tuple[str, ...] = db.list_filters()
@@ -99,7 +103,15 @@ def launch_window(lang: str):
     tab2_filters = []
     tab2_filters_checklist = np.zeros(tab2_num, dtype='bool')
     tab2_filters_were_updated = False
-    tab3_obj_name = tab3_html = tab3_spectrum = None
+    tab2_background_threshold = 0.
+    tab3_obj_name = tab3_html = tab3_spectrum = tab3_blackbody = None
+
+    def tab3_get_spectrum():
+        """ Builds the blackbody spectrum of the current slider values on demand, for plotting and pinning """
+        nonlocal tab3_spectrum
+        if tab3_spectrum is None:
+            tab3_spectrum = Spectrum.from_blackbody_redshift(visible_range, *tab3_blackbody)
+        return tab3_spectrum
 
     def tab1_tab3_update_plot(fig, fig_canvas_agg, current_tab, limit_to_vis, normalize_at_550nm, light_theme: bool, lang: str):
         pl.close_figure(fig)
@@ -107,8 +119,8 @@ def launch_window(lang: str):
         dict_to_plot = deepcopy(pinned_spectra_and_colors)
         if current_tab == 'tab1' and tab1_obj_name and tab1_spectrum not in dict_to_plot:
             dict_to_plot |= {tab1_spectrum: tab1_html}
-        if current_tab == 'tab3' and tab3_obj_name and tab3_spectrum not in dict_to_plot:
-            dict_to_plot |= {tab3_spectrum: tab3_html}
+        if current_tab == 'tab3' and tab3_obj_name and tab3_get_spectrum() not in dict_to_plot:
+            dict_to_plot |= {tab3_get_spectrum(): tab3_html}
         fig = pl.plot_spectra(dict_to_plot, limit_to_vis, normalize_at_550nm, light_theme, lang, spectra_figsize, spectra_dpi)
         fig_canvas_agg = pl.draw_figure(window1['W1_canvas'].TKCanvas, fig)
         return fig, fig_canvas_agg
@@ -136,6 +148,7 @@ def launch_window(lang: str):
 
     # GUI first loading flags
     tab1_loaded = False
+    prefetch_thread = None
     tab2_opened = False
 
     # Window events loop
@@ -163,8 +176,8 @@ def launch_window(lang: str):
             dict_to_plot = deepcopy(pinned_spectra_and_colors)
             if tab1_obj_name and tab1_spectrum not in dict_to_plot.keys():
                 dict_to_plot |= {tab1_spectrum: tab1_html}
-            if tab3_obj_name and tab3_spectrum not in dict_to_plot.keys():
-                dict_to_plot |= {tab3_spectrum: tab3_html}
+            if tab3_obj_name and tab3_get_spectrum() not in dict_to_plot.keys():
+                dict_to_plot |= {tab3_get_spectrum(): tab3_html}
             tab1_tab3_fig = pl.plot_spectra(dict_to_plot, limit_to_vis, normalize_at_550nm, light_theme, lang, spectra_figsize, spectra_dpi)
             tab1_tab3_fig_canvas_agg = pl.draw_figure(window1['W1_canvas'].TKCanvas, tab1_tab3_fig)
         elif event == 'W1_path':
@@ -264,10 +277,21 @@ def launch_window(lang: str):
                 if event == 'tab1_(re)load':
 
                     # Loading of the spectra database
-                    objectsDB, refsDB = db.import_DBs(database_folders)
+                    if not tab1_loaded:
+                        db_records = db.import_records(database_folders)
+                        objectsDB, refsDB = db.merge_records(db_records)
+                        for l in tr.langs.values():
+                            namesDB |= {l: db.obj_names_dict(objectsDB, tag='ALL', searched='', lang=l)}
+                    else:
+                        # Only the changed files are re-imported
+                        db_records, db_changes = db.reload_DBs(database_folders, db_records, objectsDB, refsDB)
+                        for l in tr.langs.values():
+                            db.update_names_dict(namesDB[l], db_changes, l, objectsDB)
                     tagsDB = db.tag_list(objectsDB)
-                    for l in tr.langs.values():
-                        namesDB |= {l: db.obj_names_dict(objectsDB, tag='ALL', searched='', lang=l)}
+                    # Reading the spectrum files in the background, the other files are read on demand
+                    if prefetch_thread is None or not prefetch_thread.is_alive():
+                        prefetch_thread = Thread(target=db.prefetch_file_spectra, args=(dict(objectsDB),), daemon=True)
+                        prefetch_thread.start()
 
                     if not tab1_loaded:
                         # Setting the default tag on the first loading
@@ -313,7 +337,7 @@ def launch_window(lang: str):
 
                         if values['-SunMultiply0-'] and isinstance(tab1_body, ReflectingBody):
                             # Multiply by Solar spectrum
-                            tab1_spectrum *= sun_norm
+                            tab1_spectrum *= get_sun_norm()
 
                         # Color calculation
                         tab1_color_xyz = ColorPoint.from_spectral_data(tab1_spectrum)
@@ -382,6 +406,8 @@ def launch_window(lang: str):
                         sg.popup(tr.gui_no_data_message[lang], title=tr.gui_output[lang], icon=icon, non_blocking=True)
                     else:
                         tab1_export = '\n' + '\t'.join(tr.gui_col[lang]) + '\n' + '_' * 36
+                        tab1_export_spectra = []
+                        tab1_export_estimations = []
                         for obj_name in tab1_displayed_namesDB.values():
                             body = database_parser(obj_name, objectsDB[obj_name])
 
@@ -390,10 +416,16 @@ def launch_window(lang: str):
 
                             if values['-SunMultiply0-'] and isinstance(body, ReflectingBody):
                                 # Multiply by Solar spectrum
-                                spectrum *= sun_norm
+                                spectrum *= get_sun_norm()
 
-                            # Color calculation
-                            color = ColorPoint.from_spectral_data(spectrum).to_color_system(color_system)
+                            tab1_export_spectra.append(spectrum)
+                            tab1_export_estimations.append(estimated)
+
+                        # Color calculation for all the objects at once
+                        tab1_export_xyz = ColorLine.from_spectral_sequence(tab1_export_spectra)
+
+                        for n, (obj_name, estimated) in enumerate(zip(tab1_displayed_namesDB.values(), tab1_export_estimations)):
+                            color = ColorPoint(tab1_export_xyz.br[:, n], xyz_color_system).to_color_system(color_system)
                             color.maximize_brightness = values['-MaximizeBrightness-'] or estimated is None
                             color.gamma_correction = values['-GammaCorrection-']
                             rgb = tuple(color.to_bit(bitness).round(rounding))
@@ -476,6 +508,13 @@ def launch_window(lang: str):
                             np.array_equal(tab2_filters_checklist_old, tab2_filters_checklist) and tab2_filters_old == tab2_filters
                         )
 
+                    # Checks for empty or non-numeric input
+                    elif event == 'tab2_background_threshold':
+                        try:
+                            tab2_background_threshold = float(values['tab2_background_threshold'])
+                        except ValueError:
+                            pass
+
                     # Image processing
                     elif event in ('tab2_preview_button', 'tab2_folder'):
                         # Reading files and formulas to evaluate
@@ -500,7 +539,10 @@ def launch_window(lang: str):
                                 sun_multiply=values['tab2_sun_multiply'],
                                 photons=values['tab2_photons'],
                                 upscale=values['tab2_upscale'],
-                                log=tab2_logger
+                                log=tab2_logger,
+                                dedup=values['tab2_dedup'],
+                                background=tab2_background_threshold if values['tab2_background'] else None,
+                                workers=int(values['tab2_workers'])
                             ),
                             ('tab2_thread', 'End of the image processing thread\n')
                         )
@@ -552,17 +594,19 @@ def launch_window(lang: str):
 
                 if event in tab3_recalc_spectrum_events:
 
-                    # Spectral data processing, updating title and radiance of surface
-                    tab3_spectrum = Spectrum.from_blackbody_redshift(visible_range, values['tab3_slider1'], values['tab3_slider2'], values['tab3_slider3'])
-                    tab3_radiance = tab3_spectrum @ get_filter('Generic_Bessell.V')
-                    window['tab3_radiance'].update(aux.exponential_notation(tab3_radiance[0]))
-                    tab3_obj_name = tab3_spectrum.name
+                    # Photometry lookup in the precomputed table, updating title and radiance of surface
+                    # (the spectrum is only needed for plotting and pinning, it's built on demand)
+                    tab3_blackbody = (values['tab3_slider1'], values['tab3_slider2'], values['tab3_slider3'])
+                    tab3_spectrum = None
+                    tab3_photometry = blackbody_redshift_photometry(*tab3_blackbody)
+                    window['tab3_radiance'].update(aux.exponential_notation(tab3_photometry[3]))
+                    tab3_obj_name = ObjectName.as_ObjectName(f'BB with T={round(tab3_blackbody[0])} K')
                     window['tab3_title2'].update(tab3_obj_name.indexed_name(lang))
 
                 if event in tab3_recalc_color_events:
 
                     # Color calculation
-                    tab3_color_xyz = ColorPoint.from_spectral_data(tab3_spectrum)
+                    tab3_color_xyz = ColorPoint(tab3_photometry[:3], xyz_color_system)
 
                 if event in tab3_update_gui_events and tab3_obj_name is not None:
 
@@ -612,8 +656,8 @@ def launch_window(lang: str):
                     window['tab3_slider1'].update(range=(0, int(values['tab3_maxtemp_num'])))
 
                 elif event == 'tab3_pin':
-                    if tab3_spectrum not in pinned_spectra_and_colors.keys():
-                        pinned_spectra_and_colors |= {tab3_spectrum: tab3_html}
+                    if tab3_obj_name and tab3_get_spectrum() not in pinned_spectra_and_colors.keys():
+                        pinned_spectra_and_colors |= {tab3_get_spectrum(): tab3_html}
 
                 elif event == 'tab3_clear':
                     pinned_spectra_and_colors = {}
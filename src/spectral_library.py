@@ -0,0 +1,269 @@
+"""
+Describes the SpectralLibrary, a storage of all the database spectra on a common wavelength grid,
+and the SimilarityIndex for the nearest color and nearest spectrum search over it.
+"""
+
+from collections.abc import Sequence
+from copy import copy
+from typing import Self
+from pathlib import Path
+import json
+import numpy as np
+
+from src.core import ObjectName, Spectrum, FilterSystem, ColorObject, xyz_color_system, nm_step, get_filter, get_xyz_cmf, visible_range, reconstruct_batch
+import src.auxiliary as aux
+import src.database as db
+import src.batch_processing as bp
+
+
+class SpectralLibrary:
+    """
+    Class to work with the spectra of many objects at once.
+    The spectra are stored as rows of a single brightness matrix on a common wavelength grid,
+    so whole-library operations (colors, synthetic photometry, mean wavelengths, scaling) are matrix products.
+
+    Attributes:
+    - `nm` (np.ndarray): common wavelength grid with `nm_step`
+    - `br` (np.ndarray): brightness matrix of shape (objects, wavelengths), zeros outside the valid ranges
+    - `start`, `end` (np.ndarray): valid wavelength range of each row (ends included)
+    - `names` (list[ObjectName]): names of the objects
+    - `tags` (list[list[str]]): database tags of the objects
+    - `estimations` (list[bool|None]): albedo estimation flags of `get_spectrum()`
+    - `geom_albedo`, `sun_multiply` (bool): settings the spectra were obtained with
+    """
+
+    def __init__(
+            self, nm: Sequence, br: np.ndarray, start: Sequence, end: Sequence, names: Sequence[ObjectName],
+            tags: Sequence[list[str]] = None, estimations: Sequence[bool | None] = None,
+            geom_albedo: bool = True, sun_multiply: bool = False
+        ):
+        """ It is assumed that the brightness matrix is already placed on the wavelength grid """
+        self.nm = np.array(nm, dtype='uint16')
+        self.br = br
+        self.start = np.array(start, dtype='uint16')
+        self.end = np.array(end, dtype='uint16')
+        self.names = [ObjectName.as_ObjectName(name) for name in names]
+        self.tags = [[]] * len(self.names) if tags is None else list(tags)
+        self.estimations = [None] * len(self.names) if estimations is None else list(estimations)
+        self.geom_albedo = geom_albedo
+        self.sun_multiply = sun_multiply
+
+    @classmethod
+    def from_spectra(cls, spectra: Sequence[Spectrum], **kwargs) -> Self:
+        """
+        Places the spectra onto the common wavelength grid, other keyword arguments are passed to the constructor.
+        The spectra are extrapolated to the visible range if necessary, as for the color calculation.
+        """
+        # Photospectra are reconstructed in batches
+        spectra = reconstruct_batch(spectra, visible_range, retain_photometry=False)
+        start = np.array([spectrum.nm[0] for spectrum in spectra], dtype='int')
+        end = np.array([spectrum.nm[-1] for spectrum in spectra], dtype='int')
+        if len(spectra) == 0:
+            nm = visible_range
+        else:
+            nm = aux.grid(start.min(), end.max(), nm_step)
+        br = np.zeros((len(spectra), nm.size))
+        for n, spectrum in enumerate(spectra):
+            index = (start[n] - int(nm[0])) // nm_step
+            br[n, index:index+spectrum.nm_len] = spectrum.br
+        return cls(nm, br, start, end, [spectrum.name for spectrum in spectra], **kwargs)
+
+    @classmethod
+    def from_database(cls, objectsDB: dict[ObjectName, dict], tag: str = 'ALL', geom_albedo: bool = True, sun_multiply: bool = False) -> Self:
+        """ Builds the library of the database objects with the specified tag """
+        obj_names = db.obj_names_list(objectsDB, tag)
+        items = [(obj_name, objectsDB[obj_name]) for obj_name in obj_names]
+        spectra, estimations, _ = bp.resolve_spectra(items, geom_albedo, sun_multiply)
+        return cls.from_spectra(
+            spectra, tags=[objectsDB[obj_name].get('tags', []) for obj_name in obj_names],
+            estimations=estimations, geom_albedo=geom_albedo, sun_multiply=sun_multiply
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def subset(self, tag: str) -> Self:
+        """ Returns a new library of the objects with the specified tag """
+        rows = [n for n, tags in enumerate(self.tags) if tag == 'ALL' or db.is_tag_in_obj(tag, {'tags': tags})]
+        return SpectralLibrary(
+            self.nm, self.br[rows], self.start[rows], self.end[rows], [self.names[n] for n in rows],
+            [self.tags[n] for n in rows], [self.estimations[n] for n in rows], self.geom_albedo, self.sun_multiply
+        )
+
+    def index(self, name: ObjectName | str) -> int:
+        """ Returns the row number of the object """
+        return self.names.index(ObjectName.as_ObjectName(name))
+
+    def spectrum(self, n: int) -> Spectrum:
+        """ Returns the row as a Spectrum defined on its valid range """
+        mask = (self.nm >= self.start[n]) & (self.nm <= self.end[n])
+        return Spectrum(self.nm[mask], self.br[n, mask], name=self.names[n])
+
+    def _place_on_grid(self, obj: Spectrum | FilterSystem) -> np.ndarray:
+        """ Returns the brightness array of shape (wavelengths, filters) on the library grid, zeros outside the grid """
+        output = np.zeros((self.nm.size, *obj.shape))
+        start = max(int(obj.nm[0]), int(self.nm[0]))
+        end = min(int(obj.nm[-1]), int(self.nm[-1]))
+        if start <= end:
+            output[(start - int(self.nm[0])) // nm_step:(end - int(self.nm[0])) // nm_step + 1] = \
+                obj.br[(start - int(obj.nm[0])) // nm_step:(end - int(obj.nm[0])) // nm_step + 1]
+        return output.reshape(self.nm.size, -1)
+
+    def photometry(self, where: str | int | float | Spectrum | FilterSystem) -> np.ndarray:
+        """
+        Returns synthetic photometry of all the spectra, an array of shape (objects) for a filter
+        or of shape (objects, filters) for a filter system.
+        Where the valid range of a spectrum does not cover the filter profile, NaN is returned.
+        """
+        if isinstance(where, str|int|float):
+            where = get_filter(where)
+        profiles = where.br.reshape(where.nm_len, -1)
+        br = nm_step * (self.br @ self._place_on_grid(where))
+        # Wavelength range of the nonzero part of each profile
+        nonzero = profiles != 0
+        profile_start = where.nm[nonzero.argmax(axis=0)]
+        profile_end = where.nm[where.nm_len - 1 - nonzero[::-1].argmax(axis=0)]
+        is_covered = (self.start[:, np.newaxis] <= profile_start) & (self.end[:, np.newaxis] >= profile_end)
+        br[~is_covered] = np.nan
+        return br[:, 0] if where.ndim == 1 else br
+
+    def xyz(self) -> np.ndarray:
+        """ Returns CIE 1931 XYZ colors of shape (3, objects), see `ColorLine.from_spectral_sequence()` """
+        return self.photometry(get_xyz_cmf()).T
+
+    def mean_nm(self) -> np.ndarray:
+        """ Returns the weighted average wavelengths, NaN for zero bolometric brightness """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (self.br @ self.nm) / self.br.sum(axis=1)
+
+    def scaled_at(self, where: str | int | float | Spectrum, how: float | np.ndarray = 1) -> Self:
+        """
+        Returns a new library with each spectrum matching the query brightness (1 by default, or an array of values)
+        at the specified filter profile or wavelength. Spectra with no positive brightness there remain unchanged.
+        """
+        current_br = self.photometry(where)
+        factors = np.ones(len(self))
+        mask = current_br > 0
+        factors[mask] = np.broadcast_to(how, current_br.shape)[mask] / current_br[mask]
+        output = copy(self)
+        output.br = self.br * factors[:, np.newaxis]
+        return output
+
+    def save(self, file: str | Path):
+        """ Saves the brightness matrix to the `.npy` file and the metadata to the `.json` file of the same name """
+        file = Path(file)
+        file.parent.mkdir(parents=True, exist_ok=True)
+        np.save(file.with_suffix('.npy'), self.br)
+        metadata = {
+            'nm_start': int(self.nm[0]),
+            'start': self.start.tolist(),
+            'end': self.end.tolist(),
+            'names': [name.raw_input for name in self.names],
+            'tags': self.tags,
+            'estimations': self.estimations,
+            'geom_albedo': self.geom_albedo,
+            'sun_multiply': self.sun_multiply,
+        }
+        with open(file.with_suffix('.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, file: str | Path) -> Self:
+        """ Loads the library saved by `save()`, the brightness matrix is memory-mapped read-only """
+        file = Path(file)
+        br = np.load(file.with_suffix('.npy'), mmap_mode='r')
+        with open(file.with_suffix('.json'), encoding='utf-8') as f:
+            metadata = json.load(f)
+        nm = np.arange(br.shape[1]) * nm_step + metadata['nm_start']
+        return cls(
+            nm, br, metadata['start'], metadata['end'], metadata['names'], metadata['tags'],
+            metadata['estimations'], metadata['geom_albedo'], metadata['sun_multiply']
+        )
+
+
+def xyz_to_lab(xyz: np.ndarray) -> np.ndarray:
+    """
+    Converts XYZ colors of shape (3, ...) to CIELAB relative to the equal-energy white point,
+    which is the XYZ color of the unit albedo spectrum.
+    """
+    xyz = np.asarray(xyz, dtype='float64')
+    delta = 6 / 29
+    f = np.where(xyz > delta**3, np.cbrt(xyz), xyz / (3 * delta**2) + 4 / 29)
+    return np.stack((116 * f[1] - 16, 500 * (f[0] - f[1]), 200 * (f[1] - f[2])))
+
+
+class SimilarityIndex:
+    """
+    Class for the search of the database objects most similar to a color or a spectrum.
+    Builds KD-trees over the CIELAB colors of the SpectralLibrary and over the principal components
+    of its spectra normalized on the visible range.
+
+    Colors of objects without albedo data are normalized to Y = 1, as they are displayed in the chromaticity mode.
+    """
+
+    def __init__(self, library: SpectralLibrary, components: int = 8):
+        """ Builds the search trees, `components` is the number of principal components of the spectra """
+        from scipy.spatial import cKDTree
+        self.library = library
+        # Color index
+        xyz = library.xyz()
+        y = xyz[1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            no_albedo = np.array([estimated is None for estimated in library.estimations], dtype='bool')
+            xyz[:, no_albedo] /= y[no_albedo]
+            chromaticity_xyz = xyz / xyz[1]
+        self.lab = np.nan_to_num(xyz_to_lab(xyz)).T
+        self.chromaticity_lab = np.nan_to_num(xyz_to_lab(chromaticity_xyz)).T
+        self.lab_tree = cKDTree(self.lab)
+        self.chromaticity_tree = cKDTree(self.chromaticity_lab[:, 1:]) # L* = 100 for all
+        # Spectra index
+        self.mask = (library.nm >= visible_range[0]) & (library.nm <= visible_range[-1])
+        spectra = self.normalize(library.br[:, self.mask])
+        self.mean_spectrum = spectra.mean(axis=0)
+        _, _, vt = np.linalg.svd(spectra - self.mean_spectrum, full_matrices=False)
+        self.components = vt[:components]
+        self.spectra_pc = (spectra - self.mean_spectrum) @ self.components.T
+        self.spectra_tree = cKDTree(self.spectra_pc)
+
+    @staticmethod
+    def normalize(br: np.ndarray) -> np.ndarray:
+        """ Scales the spectra (rows) to the unit Euclidean norm, zero spectra remain zero """
+        norm = np.linalg.norm(br, axis=-1, keepdims=True)
+        norm[norm == 0] = 1
+        return br / norm
+
+    def _result(self, distances: np.ndarray, indices: np.ndarray, k: int, exclude: int = None) -> list[tuple[ObjectName, float]]:
+        """ Converts the KD-tree query output to the list of names and distances """
+        result = []
+        for distance, index in zip(np.atleast_1d(distances), np.atleast_1d(indices)):
+            if index != exclude and index < len(self.library):
+                result.append((self.library.names[index], float(distance)))
+        return result[:k]
+
+    def nearest_color(self, color: ColorObject, k: int = 5, chromaticity: bool = False) -> list[tuple[ObjectName, float]]:
+        """
+        Returns up to k objects nearest to the linear color (for example, of a blackbody or an image pixel)
+        with their CIELAB distances. In the chromaticity mode, only a* and b* of brightness-normalized colors are compared.
+        """
+        xyz = color.to_color_system(xyz_color_system).br
+        if chromaticity:
+            distances, indices = self.chromaticity_tree.query(xyz_to_lab(xyz / xyz[1])[1:], k=k)
+        else:
+            distances, indices = self.lab_tree.query(xyz_to_lab(xyz), k=k)
+        return self._result(distances, indices, k)
+
+    def nearest_spectrum(self, spectrum: Spectrum, k: int = 5) -> list[tuple[ObjectName, float]]:
+        """ Returns up to k objects with the most similar spectral shape and their distances in the principal components space """
+        br = spectrum.define_on_range(self.library.nm[self.mask]).get_br_in_range(*self.library.nm[self.mask][[0, -1]])
+        pc = (self.normalize(br) - self.mean_spectrum) @ self.components.T
+        distances, indices = self.spectra_tree.query(pc, k=k)
+        return self._result(distances, indices, k)
+
+    def nearest_object(self, name: ObjectName | str, k: int = 5, by_color: bool = False) -> list[tuple[ObjectName, float]]:
+        """ Returns up to k other objects most similar to the library object in the spectral shape or color """
+        n = self.library.index(name)
+        if by_color:
+            distances, indices = self.lab_tree.query(self.lab[n], k=k+1)
+        else:
+            distances, indices = self.spectra_tree.query(self.spectra_pc[n], k=k+1)
+        return self._result(distances, indices, k, exclude=n)
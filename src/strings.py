@@ -417,6 +417,26 @@ gui_upscale_tooltip = {
     'ru': 'Умножает ширину и высоту в целое число раз до размера превью (без интерполяции)',
     'de': 'Multipliziert Breite und Höhe mit ganzzahligen Werten auf die Vorschaugröße (keine Interpolation)'
 }
+gui_dedup = {
+    'en': 'Process unique colors only',
+    'ru': 'Обрабатывать только уникальные цвета',
+    'de': 'Nur eindeutige Farben verarbeiten'
+}
+gui_dedup_tooltip = {
+    'en': 'For 8-bit RGB images: calculates colors for the palette of unique pixel values, faster for large images',
+    'ru': 'Для 8-битных RGB изображений: вычисляет цвета для палитры уникальных значений пикселей, быстрее для больших изображений',
+    'de': 'Für 8-Bit-RGB-Bilder: berechnet Farben für die Palette eindeutiger Pixelwerte, schneller bei großen Bildern'
+}
+gui_background = {
+    'en': 'Skip background below',
+    'ru': 'Пропустить фон ниже',
+    'de': 'Hintergrund überspringen unter'
+}
+gui_background_tooltip = {
+    'en': 'Pixels with all band values not exceeding the threshold are not processed and filled with black, faster for images of mostly dark sky',
+    'ru': 'Пиксели со всеми значениями в полосах не выше порога не обрабатываются и заполняются чёрным, быстрее для изображений с преобладанием тёмного неба',
+    'de': 'Pixel, deren Bandwerte alle den Schwellenwert nicht überschreiten, werden nicht verarbeitet und schwarz gefüllt, schneller bei Bildern mit überwiegend dunklem Himmel'
+}
 gui_chunks = {
     'en': 'Maximum chunk size (in megapixels)',
     'ru': 'Макс. размер фрагмента (в мегапикселях)',
@@ -427,6 +447,16 @@ gui_chunks_tooltip = {
     'ru': 'Предотвращает переполнение ОЗУ; число оптимизировать по показаниям Диспетчера задач',
     'de': 'Verhindert RAM-Überlauf; optimiert den Wert anhand der Messwerte des Task-Managers'
 }
+gui_chunk_workers = {
+    'en': 'Chunks processed at once',
+    'ru': 'Фрагментов одновременно',
+    'de': 'Gleichzeitig verarbeitete Chunks'
+}
+gui_chunk_workers_tooltip = {
+    'en': 'Number of parallel threads; each one holds a chunk in RAM',
+    'ru': 'Число параллельных потоков; каждый держит фрагмент в ОЗУ',
+    'de': 'Anzahl paralleler Threads; jeder hält einen Chunk im RAM'
+}
 gui_preview = {
     'en': 'Show preview',
     'ru': 'Предпросмотр',
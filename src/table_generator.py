@@ -1,20 +1,69 @@
-""" Provides a table generation function, generate_table(). """
+""" Provides table generation functions, generate_table() and generate_tables(). """
 from PIL import Image, ImageDraw, ImageFont
+from collections.abc import Sequence
+from pathlib import Path
 from time import strftime
 from math import floor, ceil, sqrt
 import numpy as np
 
 from src.core import *
 import src.database as db
+import src.batch_processing as bp
 import src.strings as tr
 
 
 def generate_table(
         objectsDB: dict, tag: str, color_system: ColorSystem, gamma_correction: bool, maximize_brightness: bool,
-        scale_factor: float, geom_albedo: bool, sun_multiply: bool, folder: str, extension: str, lang: str
+        scale_factor: float, geom_albedo: bool, sun_multiply: bool, folder: str, extension: str, lang: str,
+        workers: int = None
     ):
-    """ Creates and saves a table of colored squares for each spectral data unit that has the specified tag """
+    """
+    Creates and saves a table of colored squares for each spectral data unit that has the specified tag.
+    Colors are calculated in `workers` processes before the rendering (see `batch_processing.compute_xyz()`).
+    """
     displayed_namesDB = db.obj_names_list(objectsDB, tag)
+    colors_xyz, estimations, emissions = bp.compute_xyz(objectsDB, displayed_namesDB, geom_albedo, sun_multiply, workers)
+    file_name = f'TCT_{strftime("%Y-%m-%d_%H-%M-%S")}_{aux.normalize_string(tag)}.{extension}'
+    render_table(
+        objectsDB, displayed_namesDB, colors_xyz, estimations, emissions, tag, color_system, gamma_correction,
+        maximize_brightness, scale_factor, geom_albedo, sun_multiply, Path(folder) / file_name, lang
+    )
+
+def generate_tables(
+        objectsDB: dict, tags: Sequence[str], color_systems: Sequence[ColorSystem], langs: Sequence[str],
+        gamma_correction: bool = True, maximize_brightness: bool = False, scale_factor: float = 1.,
+        sun_multiply: bool = False, folder: str = 'tables', extension: str = 'png', workers: int = None
+    ):
+    """
+    Creates tables of each tag for both albedo modes and all the listed languages and color systems,
+    as published in the `tables` folder. Colors are calculated only once per tag and albedo mode.
+    Files are named `TCT_<tag>_<lang>_<albedo mode>_albedo.<extension>`,
+    with the color space and white point added if several color systems are requested.
+    """
+    Path(folder).mkdir(parents=True, exist_ok=True)
+    for tag in tags:
+        displayed_namesDB = db.obj_names_list(objectsDB, tag)
+        for geom_albedo in (True, False):
+            colors_xyz, estimations, emissions = bp.compute_xyz(objectsDB, displayed_namesDB, geom_albedo, sun_multiply, workers)
+            albedo_mode = 'geometric' if geom_albedo else 'spherical'
+            for color_system in color_systems:
+                for lang in langs:
+                    file_name = f'TCT_{aux.normalize_string(tag)}_{lang}_{albedo_mode}_albedo'
+                    if len(color_systems) > 1:
+                        file_name += f'_{aux.normalize_string(color_system.color_space_name)}'
+                        if color_system.white_point_name:
+                            file_name += f'_{aux.normalize_string(color_system.white_point_name)}'
+                    render_table(
+                        objectsDB, displayed_namesDB, colors_xyz, estimations, emissions, tag, color_system, gamma_correction,
+                        maximize_brightness, scale_factor, geom_albedo, sun_multiply, Path(folder) / f'{file_name}.{extension}', lang
+                    )
+
+def render_table(
+        objectsDB: dict, displayed_namesDB: list[ObjectName], colors_xyz: np.ndarray, estimations: list[bool | None],
+        emissions: list[bool], tag: str, color_system: ColorSystem, gamma_correction: bool, maximize_brightness: bool,
+        scale_factor: float, geom_albedo: bool, sun_multiply: bool, file: Path, lang: str
+    ):
+    """ Draws and saves a table of the precalculated colors (see `batch_processing.compute_xyz()`) """
     l = len(displayed_namesDB)
     notes = db.notes_list(displayed_namesDB, lang)
     notes_flag = bool(notes)
@@ -126,26 +175,15 @@ def generate_table(
     is_white_text = np.empty(l, dtype='bool')
     object_notes = []
 
-    for n, obj_name in enumerate(displayed_namesDB):
-
-        # Spectral data import and processing
-        body = database_parser(obj_name, objectsDB[obj_name])
-        spectrum, estimated = body.get_spectrum('geometric' if geom_albedo else 'spherical')
-
-        if sun_multiply and isinstance(body, ReflectingBody):
-            # Multiply by Solar spectrum
-            spectrum *= sun_norm
+    # Color postprocessing
+    colors_rgb = bp.xyz_to_rgb(colors_xyz, estimations, color_system, gamma_correction, maximize_brightness, scale_factor)
 
-        # Color calculation
-        color = ColorPoint.from_spectral_data(spectrum).to_color_system(color_system)
-        color.gamma_correction = gamma_correction
-        color.maximize_brightness = maximize_brightness or estimated is None
-        color.scale_factor = scale_factor
-        color_array = color.to_array()
+    for n, (estimated, is_emitting) in enumerate(zip(estimations, emissions)):
+        color_array = colors_rgb[:, n]
 
         # Setting of notes and shape
         is_filled = True
-        if maximize_brightness or isinstance(body, EmittingBody):
+        if maximize_brightness or is_emitting:
             object_notes.append(None)
         else:
             match estimated:
@@ -261,9 +299,8 @@ def generate_table(
                 shift = object_size
         draw.multiline_text((center_x-r_active, center_y-shift), '\n'.join(splitted), fill=text_color, font=object_font, spacing=1)
 
-    file_name = f'TCT_{strftime("%Y-%m-%d_%H-%M-%S")}_{aux.normalize_string(tag)}.{extension}'
-    img.save(f'{folder}/{file_name}')
-    print(f'Color table saved as {file_name}')
+    img.save(file)
+    print(f'Color table saved as {file.name}')
 
 def fullness(width: int, total_width: int):
     """ Column determination criterion """
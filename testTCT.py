@@ -1,9 +1,19 @@
 import unittest
+import pickle
+from pathlib import Path
+from tempfile import TemporaryDirectory
 import numpy as np
 
 import src.core as core
 import src.auxiliary as aux
-from src.table_generator import ImageFont, line_splitter
+import src.database as db
+import src.data_import as di
+import src.batch_processing as bp
+from src.cache import Cache
+from src.spectral_library import SpectralLibrary, SimilarityIndex
+from src.image_processing import lookup_colors, render_tiles
+from src.image_import import is_elementwise
+from src.table_generator import ImageFont, line_splitter, generate_tables
 
 
 class TestTCT(unittest.TestCase):
@@ -28,6 +38,17 @@ class TestTCT(unittest.TestCase):
         np.testing.assert_allclose(self.v.sd_of_nm(), 36.354015, rtol=0.01)
         np.testing.assert_allclose(self.ubv.sd_of_nm(), [21.932217, 35.816641, 36.354015], rtol=0.01)
 
+    def test_filter_registry(self):
+        profile = core.Spectrum.from_file(str(core.filter_registry.files['Generic_Bessell.V']), is_filter=True).edges_zeroed().normalize()
+        self.assertEqual(self.v, profile)
+        np.testing.assert_allclose(core.filter_registry.mean_nm('Generic_Bessell.V'), self.v.mean_nm())
+        np.testing.assert_allclose(core.filter_registry.zero_point('Generic_Bessell.V'), (self.vega @ self.v)[0])
+        self.assertTrue(core.filter_registry.flags('BOK_BASS.g')['photon_counter'])
+        with self.assertWarns(DeprecationWarning):
+            self.assertEqual(core.filter_registry.resolve('Generic_Bessell'), 'Generic_Bessell.B')
+        with self.assertRaises(core.FilterNotFoundError):
+            core.get_filter('Nonexistent.filter')
+
     def test_stub_and_convolution_possibility(self):
         self.assertIsInstance(core.Spectrum.stub() @ core.Spectrum.stub(), tuple)
         self.assertIsInstance(core.Spectrum.stub() @ core.FilterSystem.stub(), core.Photospectrum)
@@ -46,6 +67,16 @@ class TestTCT(unittest.TestCase):
         np.testing.assert_allclose((self.vega @ self.v)[0], (self.vega * self.v).integrate(), rtol=0.01)
         np.testing.assert_allclose((self.vega @ self.ubv).br, (self.vega * self.ubv).integrate(), rtol=0.01)
 
+    def test_tiled_convolution(self):
+        tile_size = core.convolution_tile_size
+        core.convolution_tile_size = 7
+        try:
+            cube = core.SpectralCube(self.vega.nm, np.outer(self.vega.br, np.arange(1, 21)).reshape(-1, 4, 5))
+            np.testing.assert_allclose((cube @ self.ubv).br[:, 3, 4], (self.vega @ self.ubv).br * 20, rtol=1e-10)
+            np.testing.assert_allclose((cube.flatten() @ self.ubv).br[:, 19], (self.vega @ self.ubv).br * 20, rtol=1e-10)
+        finally:
+            core.convolution_tile_size = tile_size
+
     def test_vega_system_zero_points(self):
         # 0.25% agreement with SVO Filter Profile Service calculations:
         np.testing.assert_allclose((self.vega @ self.v)[0], 3.62708e-11, rtol=0.0025)
@@ -85,6 +116,10 @@ class TestTCT(unittest.TestCase):
         extrapolated_v = self.v.define_on_range(core.visible_range)
         self.assertEqual(extrapolated_v.br[0], 0.)
         self.assertEqual(extrapolated_v.br[-1], 0.)
+        # Zero on the blue edge only: the red side is not extrapolated by zeros
+        ramp = core.Spectrum(np.arange(400, 705, 5), np.linspace(0, 1, 61)).define_on_range(core.visible_range)
+        self.assertEqual(ramp.br[0], 0.)
+        self.assertTrue(np.all(ramp.br[ramp.nm > 700] > 1.))
 
     def test_getting_profile_from_filter_system(self):
         v_there_and_back = core.FilterSystem.from_list([self.v])[0]
@@ -103,6 +138,224 @@ class TestTCT(unittest.TestCase):
         photospectrum = core.Photospectrum(self.ubv, (1, 1, 1), name='test photospectrum')
         np.testing.assert_allclose(photospectrum.define_on_range(core.visible_range, crop=True).br, np.ones(core.visible_range.size))
 
+    def test_filter_system_interning(self):
+        filters = ('Generic_Bessell.U', 'Generic_Bessell.B', 'Generic_Bessell.V')
+        self.assertIs(core.FilterSystem.from_list(filters, name='UBV'), self.ubv)
+        unnamed = core.FilterSystem.from_list(filters)
+        self.assertIsNot(unnamed, self.ubv)
+        self.assertIs(unnamed.br, self.ubv.br)
+        self.assertIsNot(core.FilterSystem.from_list(self.ubv, name='UBV'), self.ubv)
+        self.assertFalse(self.ubv.br.flags.writeable)
+        # Unused filter systems are not kept
+        key = ('Generic_Bessell.B', 'StilesBurch2deg.r')
+        core.FilterSystem.from_list(key)
+        self.assertNotIn(key, core._interned_filter_systems)
+
+    def test_reconstruction_operator_cache(self):
+        operator = core.reconstruction_operator(self.ubv, core.visible_range)
+        self.assertIs(core.reconstruction_operator(core.FilterSystem.from_list(self.ubv), core.visible_range), operator)
+        nm, A, T_T, _, _ = operator
+        br0 = np.array((0.8, 1.0, 1.1))
+        photospectrum = core.Photospectrum(self.ubv, br0)
+        np.testing.assert_allclose(photospectrum.define_on_range(core.visible_range).br, np.linalg.solve(A, T_T @ br0), rtol=1e-10)
+
+    def test_batch_reconstruction(self):
+        spectra = [
+            core.Photospectrum(self.ubv, (0.8, 1.0, 1.1), (0.01, 0.01, 0.02)),
+            core.Photospectrum(self.ubv, (1.2, 1.0, 0.9)),
+            self.vega,
+            core.Photospectrum(self.rgb, (0.5, 0.6, 0.7)),
+        ]
+        for batched, spectrum in zip(core.reconstruct_batch(spectra, core.visible_range, crop=True), spectra):
+            single = spectrum.define_on_range(core.visible_range, crop=True)
+            np.testing.assert_allclose(batched.br, single.br, rtol=1e-10)
+            if single.sd is not None:
+                np.testing.assert_allclose(batched.sd, single.sd, rtol=1e-10)
+        colors = core.ColorLine.from_spectral_sequence(spectra)
+        for n, spectrum in enumerate(spectra):
+            np.testing.assert_allclose(colors.br[:, n], core.ColorPoint.from_spectral_data(spectrum).br, rtol=1e-10)
+
+    def test_color_kernel(self):
+        cube = core.PhotospectralCube(self.ubv, np.random.default_rng(0).random((3, 4, 5)))
+        np.testing.assert_allclose(core.ColorImage.from_spectral_data(cube).br, (cube @ core.xyz_cmf).br, rtol=1e-10)
+        self.assertIs(core.color_kernel(core.FilterSystem.from_list(self.ubv)), core.color_kernel(self.ubv))
+
+    def test_lookup_colors(self):
+        rng = np.random.default_rng(0)
+        bands = [(rng.integers(0, 256, (4, 5)), 255), (rng.integers(0, 65536, (4, 5)), 65535)]
+        formulas = ['x', '2*x**2']
+        kernel = rng.random((3, 2))
+        cube = np.stack([eval(formula, {'x': raw / depth}) for (raw, depth), formula in zip(bands, formulas)])
+        np.testing.assert_allclose(lookup_colors(bands, formulas, kernel), np.tensordot(kernel, cube, 1), rtol=1e-12)
+        background = np.all(cube <= 0.5, axis=0)
+        masked = lookup_colors(bands, formulas, kernel, threshold=0.5)
+        np.testing.assert_allclose(masked[:, ~background], np.tensordot(kernel, cube, 1)[:, ~background], rtol=1e-12)
+        self.assertTrue(np.all(masked[:, background] == 0))
+        for formula in ('x', '2*x**2', '-abs(x - 0.5) / 3'):
+            self.assertTrue(is_elementwise(formula))
+        for formula in ('x / x.max()', 'max(x)', 'x - np.mean(x)', 'x[::-1]', 'x if x else 0', 'x +'):
+            self.assertFalse(is_elementwise(formula))
+
+    def test_background_mask(self):
+        br = np.zeros((3, 4, 5))
+        br[1, 2, 3] = 1.
+        br[0, 0, 1] = 0.2
+        cube = core.PhotospectralCube(self.ubv, br)
+        background = cube.background_mask(0.5)
+        self.assertEqual(np.count_nonzero(~background), 1)
+        square = cube.flatten(~background)
+        self.assertIsInstance(square, core.PhotospectralSquare)
+        np.testing.assert_array_equal(square.br, [[0.], [1.], [0.]])
+
+    def test_lazy_constants(self):
+        namespace = {}
+        exec('from src.core import *', namespace)
+        self.assertIs(namespace['sun_norm'], core.get_sun_norm())
+        self.assertIs(namespace['visible_range'], core.visible_range)
+        white_points = core.ColorSystem.supported_white_points
+        np.testing.assert_allclose(white_points.get('Sun'), core.ColorSystem.spectrum_to_white_point(core.get_sun_SI()))
+        self.assertFalse(any(callable(value) for value in white_points.values()))
+        self.assertIs(dict(white_points.items())['Vega'], white_points['Vega'])
+
+    def test_lazy_spectral_cube(self):
+        from astropy.io import fits
+        br = np.random.default_rng(0).random((50, 6, 5))
+        br[:, :2] = 0
+        with TemporaryDirectory() as folder:
+            file = str(Path(folder, 'cube.fits'))
+            hdul = fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(br, name='SCI'), fits.ImageHDU(np.linspace(355, 835, 50), name='WAVELENGTH')])
+            hdul.writeto(file)
+            expected = core.ColorImage.from_spectral_data(core.SpectralCube.from_file(file)).br
+            cube = core.LazySpectralCube.from_file(file)
+            self.assertEqual((cube.width, cube.height), expected.shape[1:])
+            log = lambda message: None
+            np.testing.assert_allclose(render_tiles(cube, lambda square: square, 2*cube.width, log=log), expected, rtol=1e-12)
+            np.testing.assert_allclose(render_tiles(cube, lambda square: square, 2*cube.width, 0., log), expected, rtol=1e-12)
+            del cube # releases the memory map
+
+    def test_lazy_spectral_cube_preview_background(self):
+        from astropy.io import fits
+        from src.image_processing import image_parser
+        br = np.random.default_rng(0).random((50, 6, 5)) + 1
+        br[:, :2] = 0.1 # dim background
+        with TemporaryDirectory() as folder:
+            file = str(Path(folder, 'cube.fits'))
+            hdul = fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(br, name='SCI'), fits.ImageHDU(np.linspace(355, 835, 50), name='WAVELENGTH')])
+            hdul.writeto(file)
+            images = []
+            log = lambda message, img=None: images.append(img) if img is not None else None
+            image_parser(2, True, 100, 10**6, file, [], [], [], False, False, False, False, log, background=0.5)
+        self.assertEqual(len(images), 1)
+        xyz = images[0].br
+        self.assertTrue(np.all(xyz[:, :, :2] == 0)) # the FITS axes are transposed
+        self.assertTrue(np.all(xyz[:, :, 2:] > 0))
+
+    def test_lazy_spectral_cube_extrapolation(self):
+        from astropy.io import fits
+        br = np.random.default_rng(0).random((40, 6, 5)) + 1
+        br[:, 0, 3] = 0.5 # zero derivative in one tile only
+        with TemporaryDirectory() as folder:
+            file = str(Path(folder, 'cube.fits'))
+            hdul = fits.HDUList([fits.PrimaryHDU(), fits.ImageHDU(br, name='SCI'), fits.ImageHDU(np.linspace(420, 700, 40), name='WAVELENGTH')])
+            hdul.writeto(file)
+            expected = core.ColorImage.from_spectral_data(core.SpectralCube.from_file(file)).br
+            cube = core.LazySpectralCube.from_file(file)
+            np.testing.assert_allclose(render_tiles(cube, lambda square: square, cube.width, log=lambda message: None), expected, rtol=1e-12)
+            del cube # releases the memory map
+
+    def test_binned_fits_reading(self):
+        from astropy.table import Table
+        rng = np.random.default_rng(0)
+        table = Table({'WAVELENGTH': np.linspace(3000, 9000, 20000), 'FLUX': rng.random(20000), 'SYSERROR': rng.random(20000)})
+        table['WAVELENGTH'].unit = 'Angstrom'
+        for column in ('FLUX', 'SYSERROR'):
+            table[column].unit = 'W / (m2 nm)'
+        with TemporaryDirectory() as folder:
+            file = str(Path(folder, 'spectrum.fits'))
+            table.write(file)
+            default_min_size = di.binned_reading_min_size
+            di.binned_reading_min_size = 1000
+            try:
+                nm, br, sd = di.file_reader(file, bin_step=core.nm_step)
+            finally:
+                di.binned_reading_min_size = default_min_size
+            self.assertEqual(nm.size, br.size)
+            expected = core.Spectrum.from_array(*di.file_reader(file))
+            np.testing.assert_array_equal(nm, expected.nm)
+            np.testing.assert_allclose(br, expected.br, rtol=1e-10)
+            np.testing.assert_allclose(sd, expected.sd, rtol=1e-10)
+
+    def test_spectrum_cache_file(self):
+        default_folder = core.spectra_cache_folder
+        default_red_limit = core.nm_red_limit
+        with TemporaryDirectory() as folder:
+            file = str(Path(folder, 'spectrum.txtP'))
+            np.savetxt(file, [[400, 1., 0.1], [500, 2., 0.2], [600, 1.5, 0.1]])
+            core.spectra_cache_folder = Path(folder, 'cache')
+            try:
+                expected = core.Spectrum.from_file.__wrapped__(file)
+                cache_file = core.spectrum_cache_file(file, False, False)
+                self.assertTrue(cache_file.exists())
+                cached = core.Spectrum.from_file.__wrapped__(file, 'cached')
+                # Other processing settings do not use the file
+                core.nm_red_limit += 1
+                self.assertNotEqual(core.spectrum_cache_file(file, False, False), cache_file)
+            finally:
+                core.nm_red_limit = default_red_limit
+                core.spectra_cache_folder = default_folder
+        self.assertEqual(cached.name.raw_input, 'cached')
+        np.testing.assert_array_equal(cached.nm, expected.nm)
+        np.testing.assert_array_equal(cached.br, expected.br)
+        np.testing.assert_array_equal(cached.sd, expected.sd)
+
+    def test_prefetch_file_spectra(self):
+        default_folder = core.spectra_cache_folder
+        with TemporaryDirectory() as folder:
+            file = str(Path(folder, 'spectrum.txt'))
+            np.savetxt(file, [[400, 1.], [500, 2.], [600, 1.5]])
+            objectsDB = {core.ObjectName('A'): {'file': file}, core.ObjectName('B'): {'file': file}, core.ObjectName('C'): {'nm': [550], 'br': [1]}}
+            core.spectra_cache_folder = Path(folder, 'cache')
+            try:
+                self.assertEqual(db.prefetch_file_spectra(objectsDB, tag='featured'), 0)
+                self.assertEqual(db.prefetch_file_spectra(objectsDB), 1)
+                self.assertTrue(core.spectrum_cache_file(file, False, False).exists())
+                hits = core.Spectrum.from_file.cache_info().hits
+                core.database_parser(core.ObjectName('A'), objectsDB[core.ObjectName('A')])
+                self.assertEqual(core.Spectrum.from_file.cache_info().hits, hits + 1)
+            finally:
+                core.spectra_cache_folder = default_folder
+
+    def test_cache(self):
+        from threading import Thread, Event
+        cache = Cache('test', budget=3000)
+        release = Event()
+        calls = []
+        def builder():
+            calls.append(1)
+            release.wait()
+            return np.zeros(100) # 800 bytes
+        results = []
+        threads = [Thread(target=lambda: results.append(cache.get('a', builder))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        cache.get('b', lambda: np.zeros(100))
+        cache.get('a', builder) # the most recently used
+        cache.get('c', lambda: np.zeros(200)) # evicts "b"
+        cache.get('d', lambda: np.zeros(1000)) # over the budget, not stored
+        info = cache.info()
+        self.assertEqual((info.misses, info.evictions, info.entries), (4, 1, 2))
+        self.assertEqual(info.hits + info.waits, 4)
+        self.assertLessEqual(info.nbytes, info.budget)
+        cache = Cache('test', budget=3000, max_entries=1)
+        cache.get('a', lambda: np.zeros(10))
+        cache.get('b', lambda: np.zeros(10))
+        self.assertEqual((cache.info().entries, cache.info().evictions), (1, 1))
+
     def test_sd_parsing(self):
         np.testing.assert_equal(aux.parse_value_sd(0.202), (0.202, None))
         np.testing.assert_equal(aux.parse_value_sd([0.202, 0.0665]), (0.202, 0.0665))
@@ -190,6 +443,9 @@ class TestTCT(unittest.TestCase):
     def test_name_translation(self):
         np.testing.assert_equal(core.ObjectName('Iocaste').name('ru'), 'Иокасте') # not "Иоcaste"
         np.testing.assert_equal(core.ObjectName('PanSTARRS').name('ru'), 'PanSTARRS') # not "ПанSTARRS"
+        name = core.ObjectName('(1) Ceres')
+        name('ru')
+        self.assertFalse(hasattr(pickle.loads(pickle.dumps(name)), '_strings'))
 
     def test_db(self):
         db = {
@@ -214,6 +470,146 @@ class TestTCT(unittest.TestCase):
         for key, value in db.items():
             body = core.database_parser(key, value)
 
+    def test_database_snapshot_record(self):
+        with TemporaryDirectory() as folder:
+            file = Path(folder) / 'test.json5'
+            file.write_text('{"(1) Ceres": {"tags": ["minor body"]}, "ref": ["a"]}', encoding='UTF-8')
+            record = db.import_file(file)
+            self.assertEqual(list(record['objects']), [core.ObjectName('(1) Ceres')])
+            self.assertEqual(record['refs'], {'ref': ['a']})
+            self.assertIs(db.import_file(file, record), record)
+            file.write_text('{"Vesta": {}}', encoding='UTF-8')
+            self.assertEqual(list(db.import_file(file, record)['objects']), [core.ObjectName('Vesta')])
+
+    def test_database_reload(self):
+        snapshot_file = db.snapshot_file
+        with TemporaryDirectory() as folder:
+            db.snapshot_file = Path(folder) / 'snapshot.pickle'
+            try:
+                (Path(folder) / '1.json5').write_text('{"Ceres": {"albedo": 0.09}, "Vesta": {}}', encoding='UTF-8')
+                (Path(folder) / '2.json5').write_text('{"Pallas": {}}', encoding='UTF-8')
+                records = db.import_records([folder])
+                self.assertEqual(db.load_snapshot().keys(), records.keys())
+                # A snapshot made by other code is not used
+                with open(db.snapshot_file, 'wb') as f:
+                    pickle.dump({'version': db.snapshot_version, 'files': records}, f)
+                self.assertEqual(db.load_snapshot(), {})
+                objectsDB, refsDB = db.merge_records(records)
+                (Path(folder) / '1.json5').write_text('{"Ceres": {"albedo": 0.1}, "Hygiea": {}}', encoding='UTF-8')
+                records, changes = db.reload_DBs([folder], records, objectsDB, refsDB)
+                self.assertEqual(changes, {
+                    'added': [core.ObjectName('Hygiea')],
+                    'removed': [core.ObjectName('Vesta')],
+                    'modified': [core.ObjectName('Ceres')]
+                })
+                self.assertEqual(list(objectsDB.items()), list(db.import_DBs([folder])[0].items()))
+                # Appending an object keeps the other entries as they are
+                names = db.obj_names_dict(objectsDB, tag='ALL', searched='', lang='en')
+                old_objects, old_names = dict(objectsDB), dict(names)
+                (Path(folder) / '2.json5').write_text('{"Pallas": {}, "Juno": {}}', encoding='UTF-8')
+                records, changes = db.reload_DBs([folder], records, objectsDB, refsDB)
+                self.assertEqual(changes['added'], [core.ObjectName('Juno')])
+                db.update_names_dict(names, changes, 'en', objectsDB)
+                self.assertEqual(list(objectsDB), [*old_objects, core.ObjectName('Juno')])
+                self.assertEqual(list(names), [*old_names, 'Juno'])
+                for obj_name, obj_data in old_objects.items():
+                    self.assertIs(objectsDB[obj_name], obj_data)
+                # An object added to a file in the middle takes its position
+                (Path(folder) / '1.json5').write_text('{"Ceres": {"albedo": 0.1}, "Hygiea": {}, "Eunomia": {}}', encoding='UTF-8')
+                records, changes = db.reload_DBs([folder], records, objectsDB, refsDB)
+                db.update_names_dict(names, changes, 'en', objectsDB)
+                self.assertEqual(list(objectsDB.items()), list(db.import_DBs([folder])[0].items()))
+                self.assertEqual(list(names), ['Ceres', 'Hygiea', 'Eunomia', 'Pallas', 'Juno'])
+            finally:
+                db.snapshot_file = snapshot_file
+
+    def test_batch_colors(self):
+        objectsDB = {
+            core.ObjectName('Gray'): {'nm': [400, 700], 'br': [1, 1], 'albedo': [550, 0.5]},
+            core.ObjectName('Red'): {'nm': [400, 700], 'br': [0, 1]},
+        }
+        color_system = core.ColorSystem('sRGB', 'Illuminant E')
+        columns = bp.compute_colors(objectsDB, 'ALL', color_system, workers=1)
+        self.assertEqual(columns['name'], ['Gray', 'Red'])
+        self.assertEqual(columns['estimated'], [False, None])
+        for n, obj_name in enumerate(objectsDB):
+            spectrum, estimated = core.database_parser(obj_name, objectsDB[obj_name]).get_spectrum('geometric')
+            color = core.ColorPoint.from_spectral_data(spectrum).to_color_system(color_system)
+            color.maximize_brightness = estimated is None
+            color.gamma_correction = True
+            self.assertTrue(np.allclose(color.to_array(), (columns['R'][n], columns['G'][n], columns['B'][n])))
+            self.assertEqual(color.to_html(), columns['hex'][n])
+        with TemporaryDirectory() as folder:
+            for file_format, save in bp.output_formats.items():
+                save(columns, Path(folder) / f'colors.{file_format}')
+            self.assertTrue(np.array_equal(np.load(Path(folder) / 'colors.npz')['R'], columns['R']))
+
+    def test_generate_tables(self):
+        objectsDB = {
+            core.ObjectName('Gray'): {'nm': [400, 700], 'br': [1, 1], 'albedo': [550, 0.5], 'tags': ['test']},
+            core.ObjectName('Red'): {'nm': [400, 700], 'br': [0, 1], 'tags': ['test']},
+        }
+        color_systems = (core.ColorSystem('sRGB', 'Illuminant E'), core.ColorSystem('sRGB'))
+        with TemporaryDirectory() as folder:
+            generate_tables(objectsDB, ('test',), color_systems, ('en', 'ru'), folder=folder, workers=1)
+            self.assertEqual(len(list(Path(folder).iterdir())), 2 * 2 * 2)
+            self.assertTrue((Path(folder) / 'TCT_test_ru_spherical_albedo_sRGB_IlluminantE.png').exists())
+
+    def test_spectral_library(self):
+        objectsDB = {
+            core.ObjectName('Gray'): {'nm': [400, 700], 'br': [1, 1], 'albedo': [550, 0.5], 'tags': ['test']},
+            core.ObjectName('Red'): {'nm': [500, 1000], 'br': [0, 1]},
+        }
+        library = SpectralLibrary.from_database(objectsDB)
+        xyz, _, _ = bp.compute_xyz(objectsDB, list(objectsDB), workers=1)
+        self.assertTrue(np.allclose(library.xyz(), xyz))
+        for n in range(len(library)):
+            self.assertAlmostEqual(library.photometry(550)[n], (library.spectrum(n) @ core.get_filter(550))[0])
+            self.assertAlmostEqual(library.mean_nm()[n], library.spectrum(n).mean_nm())
+        self.assertTrue(np.isnan(library.photometry(300)[1]))
+        self.assertTrue(np.allclose(library.scaled_at(550, 0.3).photometry(550), 0.3))
+        self.assertEqual(library.subset('test').names, [core.ObjectName('Gray')])
+        with TemporaryDirectory() as folder:
+            library.save(Path(folder) / 'library')
+            loaded = SpectralLibrary.load(Path(folder) / 'library')
+            self.assertTrue(np.array_equal(loaded.br, library.br))
+            self.assertEqual(loaded.names, library.names)
+            del loaded # releases the memory-mapped file
+
+    def test_similarity_search(self):
+        nm = np.arange(400, 705, 5)
+        library = SpectralLibrary.from_spectra([
+            core.Spectrum(nm, np.full(nm.size, 0.5), name='Gray'),
+            core.Spectrum(nm, np.linspace(0, 1, nm.size), name='Red'),
+            core.Spectrum(nm, np.linspace(1, 0, nm.size), name='Blue'),
+        ], estimations=(False, False, None))
+        index = SimilarityIndex(library, components=2)
+        dark_red = library.spectrum(1) * 0.7
+        self.assertEqual(index.nearest_spectrum(dark_red, k=1)[0][0], core.ObjectName('Red'))
+        self.assertEqual(index.nearest_color(core.ColorPoint.from_spectral_data(dark_red), k=1)[0][0], core.ObjectName('Red'))
+        blue = core.ColorPoint.from_spectral_data(library.spectrum(2) * 0.01)
+        self.assertEqual(index.nearest_color(blue, k=1, chromaticity=True)[0][0], core.ObjectName('Blue'))
+        self.assertCountEqual([name for name, _ in index.nearest_object('Gray', k=5)], [core.ObjectName('Red'), core.ObjectName('Blue')])
+
+    def test_blackbody_table(self):
+        v_filter = core.get_filter('Generic_Bessell.V')
+        for temperature, velocity, vII in ((0, 0, 0), (5772, 0, 0), (3000, 0.5, 0.3), (20000, -0.9, 0), (300, 0.99, 0.9), (1000, 1, 0)):
+            spectrum = core.Spectrum.from_blackbody_redshift(core.visible_range, temperature, velocity, vII)
+            expected = (*core.ColorPoint.from_spectral_data(spectrum).br, (spectrum @ v_filter)[0])
+            self.assertTrue(np.allclose(core.blackbody_redshift_photometry(temperature, velocity, vII), expected, rtol=1e-4, atol=0))
+
+    def test_blackbody_batch(self):
+        temperature = np.array((0, 1500, 5772, 12000))
+        velocity = np.array((0, 0.2, -0.3, 0.5))
+        color_system = core.ColorSystem('sRGB', 'Illuminant D65')
+        colors, radiance = core.blackbody_redshift_colors(temperature, velocity, 0.1, color_system, radiance=True)
+        self.assertEqual(colors.shape, (4, 3))
+        for n in range(4):
+            spectrum = core.Spectrum.from_blackbody_redshift(core.visible_range, temperature[n], velocity[n], 0.1)
+            color = core.ColorPoint.from_spectral_data(spectrum).to_color_system(color_system)
+            self.assertTrue(np.allclose(colors[n], color.br))
+            self.assertAlmostEqual(radiance[n], (spectrum @ core.get_filter('Generic_Bessell.V'))[0])
+
     def test_line_splitter(self):
         object_font = ImageFont.truetype('src/fonts/FiraSansExtraCondensed-Regular.ttf', 20, layout_engine=ImageFont.Layout.BASIC)
         self.assertEqual(line_splitter('Sun', object_font, 114), ['Sun'])